@@ -1,6 +1,12 @@
 import numpy as np
+from collections import deque
 import matplotlib.pyplot as plt
-import heapq
+from events import ARRIVAL, DEPARTURE
+from event_list import make_event_list
+from server_pool import FreeServerPool
+from routing import RoutingTable
+from variates import SERVICE, ROUTING, RandomStreams
+from recorder import AGENT_COLUMNS, DepartureRecorder
 
 class Agent:
     def __init__(self, agent_id):
@@ -22,34 +28,42 @@ class Server:
         self.current_agent = None
 
 class Queue:
-    def __init__(self, queue_id, num_servers, service_rate):
+    def __init__(self, queue_id, num_servers, service_rate, service_stream=None):
         self.queue_id = queue_id
         self.servers = [Server(i) for i in range(num_servers)]
+        self.free_servers = FreeServerPool(num_servers)
         self.service_rate = service_rate
-        self.queue = []
+        self.queue = deque()
+        if service_stream is None:
+            service_stream = RandomStreams().exponential(service_rate, SERVICE, queue_id, decimals=3)
+        self.service_stream = service_stream
 
     def generate_service_time(self):
-        return round(np.random.exponential(1.0 / self.service_rate), 3)
+        return self.service_stream.draw()
 
 class OpenQueueNetwork:
-    def __init__(self, num_agents, service_rates, max_time, num_servers, prob_matrix, cycle_delay):
+    def __init__(self, num_agents, service_rates, max_time, num_servers, prob_matrix, cycle_delay, event_list='heap', seed=None):
         self.num_agents = num_agents
         self.service_rates = service_rates
         self.max_time = max_time
         self.num_servers = num_servers
         self.prob_matrix = prob_matrix
         self.cycle_delay = cycle_delay
-        self.queues = [Queue(i, num_servers[i], service_rates[i]) for i in range(len(num_servers))]
+        self.streams = RandomStreams(seed)  # seed=None follows np.random.seed()
+        self.routing_streams = [self.streams.uniform(ROUTING, i) for i in range(len(num_servers))]
+        self.routing = RoutingTable(prob_matrix)  # alias tables compiled once
+        self.queues = [Queue(i, num_servers[i], service_rates[i], self.streams.exponential(service_rates[i], SERVICE, i, decimals=3))
+                       for i in range(len(num_servers))]
         self.time = 0
-        self.event_queue = []
-        self.agents_data = []
+        self.event_queue = make_event_list(event_list)
+        self.agents_data = DepartureRecorder(AGENT_COLUMNS + ('cycles_completed',))  # departure records, one row per departure
         self.agent_counter = 0
         self.master_queue = [(0, "source", "target", "event_type")]
         self.agents = [Agent(i) for i in range(num_agents)]
     
     def advance_time(self):
         if self.event_queue:
-            self.time, event_type, agent, queue_id = heapq.heappop(self.event_queue)
+            self.time, event_type, _, agent, queue_id = self.event_queue.pop()
             if self.time > self.max_time:
                 return False, None, None, None
             return True, event_type, agent, queue_id
@@ -58,10 +72,10 @@ class OpenQueueNetwork:
     def handle_arrival(self, agent, queue_id):
         queue = self.queues[queue_id]
         agent.queue_length_on_arrival = len(queue.queue)
-        free_server = next((server for server in queue.servers if not server.is_busy), None)
+        free_server_id = queue.free_servers.acquire()
         
-        if free_server:
-            self.assign_server(free_server, agent, queue_id)
+        if free_server_id is not None:
+            self.assign_server(queue.servers[free_server_id], agent, queue_id)
         else:
             queue.queue.append(agent)
         
@@ -75,14 +89,16 @@ class OpenQueueNetwork:
         server.current_agent = None
         
         if queue.queue:
-            next_agent = queue.queue.pop(0)
+            next_agent = queue.queue.popleft()
             self.assign_server(server, next_agent, queue_id)
+        else:
+            queue.free_servers.release(server.server_id)
         
         next_queue_id = self.next_queue(queue_id)
         if next_queue_id is not None:
             agent.arrival_time = self.time
             agent.server_id = None
-            heapq.heappush(self.event_queue, (self.time, 'arrival', agent, next_queue_id))
+            self.event_queue.push(self.time, ARRIVAL, agent, next_queue_id)
         
         self.capture_event(agent, queue_id, 'departure')
         self.schedule_reentry(agent)  # Reintroduce the agent into the system
@@ -94,10 +110,10 @@ class OpenQueueNetwork:
         agent.server_id = server.server_id
         service_time = self.queues[queue_id].generate_service_time()
         agent.departure_time = self.time + service_time
-        heapq.heappush(self.event_queue, (agent.departure_time, 'departure', agent, queue_id))
+        self.event_queue.push(agent.departure_time, DEPARTURE, agent, queue_id)
     
     def log_departure(self, agent, queue_id):
-        self.agents_data.append([
+        self.agents_data.record(
             agent.agent_id,
             agent.arrival_time,
             agent.service_start_time,
@@ -106,12 +122,11 @@ class OpenQueueNetwork:
             queue_id,
             agent.queue_length_on_arrival,
             agent.cycles_completed
-        ])
+        )
     
     def next_queue(self, current_queue_id):
-        probabilities = self.prob_matrix[current_queue_id]
-        next_queue_id = np.random.choice(len(probabilities), p=probabilities)
-        return next_queue_id if next_queue_id != len(probabilities) else None
+        # Probability mass missing from the row leaves the network
+        return self.routing.sample(current_queue_id, self.routing_streams[current_queue_id].draw())
     
     def capture_event(self, agent, queue_id, event_type):
         pass
@@ -153,27 +168,27 @@ class OpenQueueNetwork:
         agent.cycles_completed += 1
         reentry_time = self.time + self.cycle_delay
         agent.arrival_time = reentry_time
-        heapq.heappush(self.event_queue, (reentry_time, 'arrival', agent, 0))
+        self.event_queue.push(reentry_time, ARRIVAL, agent, 0)
 
     
     def simulate(self):
         for agent in self.agents:
-            heapq.heappush(self.event_queue, (agent.arrival_time, 'arrival', agent, 0))
+            self.event_queue.push(agent.arrival_time, ARRIVAL, agent, 0)
         
         while True:
             continue_simulation, event_type, agent, queue_id = self.advance_time()
             if not continue_simulation:
                 break
             
-            if event_type == 'arrival':
+            if event_type == ARRIVAL:
                 self.handle_arrival(agent, queue_id)
-            elif event_type == 'departure':
+            elif event_type == DEPARTURE:
                 self.handle_departure(agent, queue_id)
                               
-        return np.array(self.agents_data), np.array(self.master_queue)
+        return self.agents_data.data(), np.array(self.master_queue)
 
     def visualize(self):
-        data = np.array(self.agents_data)
+        data = self.agents_data.data()
         plt.figure(figsize=(12, 6))
         for queue_id in np.unique(data[:, 5]):
             queue_data = data[data[:, 5] == queue_id]
@@ -1,8 +1,17 @@
-import numpy as np
-import heapq
+from collections import deque
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 import networkx as nx
+from events import ARRIVAL, DEPARTURE
+from event_list import make_event_list
+from server_pool import FreeServerPool
+from agent_pool import AgentPool
+from routing import RoutingTable
+from variates import ARRIVALS, SERVICE, ROUTING, RandomStreams
+from recorder import DepartureRecorder
+from station_stats import StationStatistics
+from timeseries import DecimatedSeries
+from warmup import recorder_reports
 
 class Agent:
     def __init__(self, arrival_time, agent_id, queue_path):
@@ -25,40 +34,42 @@ class Server:
         self.current_agent = None
 
 class MMmQueue:
-    def __init__(self, arrival_rate, service_rate, max_time, num_servers, max_queue_length):
+    def __init__(self, arrival_rate, service_rate, max_time, num_servers, max_queue_length, event_list='heap', queue_id=0, streams=None):
         self.arrival_rate = arrival_rate
         self.service_rate = service_rate
         self.max_time = max_time
         self.num_servers = num_servers
-        self.queue = []
+        self.queue = deque()
         self.time = 0
-        self.event_queue = []
-        self.agents_data = []
+        self.queue_id = queue_id
+        self.event_queue = make_event_list(event_list)  # replaced by the network's event list inside a JacksonNetwork
+        self.agent_pool = AgentPool()  # replaced by the network's agent pool inside a JacksonNetwork
+        self.agents_data = DepartureRecorder(('arrival', 'service_start', 'departure', 'queue_length_on_arrival', 'server_id', 'agent_id'))  # departure records, one row per departure
         self.servers = [Server(i) for i in range(num_servers)]
+        self.free_servers = FreeServerPool(num_servers)
         self.agent_counter = 0
         self.max_queue_length = max_queue_length
 
-        self.total_time_in_system = 0
-        self.total_time_in_queue = 0
-        self.total_time_in_service = 0
-        self.total_arrivals = 0
-        self.total_departures = 0
-        self.blocked_customers = 0
-        self.last_event_time = 0
-        self.queue_length_data = []
+        self.stats = StationStatistics(num_servers)  # time-weighted L, L_q, L_s, no history kept
+        self.queue_length_data = DecimatedSeries()  # (time, queue length), bounded memory
+
+        # RandomStreams shared with the network, keyed by queue_id
+        if streams is None:
+            streams = RandomStreams()
+        self.interarrival_stream = streams.exponential(arrival_rate, ARRIVALS, queue_id, decimals=3)
+        self.service_stream = streams.exponential(service_rate, SERVICE, queue_id, decimals=3)
 
     def generate_interarrival_time(self):
-        return round(np.random.exponential(1.0 / self.arrival_rate), 3)
+        return self.interarrival_stream.draw()
 
     def generate_service_time(self):
-        return round(np.random.exponential(1.0 / self.service_rate), 3)
+        return self.service_stream.draw()
 
     def handle_arrival(self, agent, current_time):
-        self.update_statistics(current_time)
-        self.queue_length_data.append((current_time, len(self.queue)))
-        self.total_arrivals += 1
+        self.queue_length_data.append(current_time, len(self.queue))
         agent.queue_length_on_arrival = len(self.queue)
-        free_server = next((server for server in self.servers if not server.is_busy), None)
+        free_server_id = self.free_servers.acquire()
+        free_server = self.servers[free_server_id] if free_server_id is not None else None
         if free_server:
             free_server.is_busy = True
             free_server.current_agent = agent
@@ -66,67 +77,54 @@ class MMmQueue:
             agent.server_id = free_server.server_id
             service_time = self.generate_service_time()
             agent.departure_time = current_time + service_time
-            heapq.heappush(self.event_queue, (agent.departure_time, 'departure', agent))
+            self.event_queue.push(agent.departure_time, DEPARTURE, agent, self.queue_id)
+            blocked = False
         elif len(self.queue) < self.max_queue_length:
             self.queue.append(agent)
+            blocked = False
         else:
-            self.blocked_customers += 1
+            blocked = True
+        self.stats.arrival(current_time, len(self.queue), self.busy_servers(), blocked)
+        if blocked:
+            # Rejected agents leave the network here, nothing refers to them any more
+            self.agent_pool.release(agent)
 
     def handle_departure(self, agent, current_time):
-        self.update_statistics(current_time)
-        self.queue_length_data.append((current_time, len(self.queue)))
-        self.total_departures += 1
-        self.agents_data.append([
+        self.queue_length_data.append(current_time, len(self.queue))
+        self.agents_data.record(
             agent.arrival_time,
             agent.service_start_time,
             current_time,
             agent.queue_length_on_arrival,
             agent.server_id,
             agent.agent_id
-        ])
+        )
 
         server = self.servers[agent.server_id]
         server.is_busy = False
         server.current_agent = None
         
         if self.queue:
-            next_agent = self.queue.pop(0)
+            next_agent = self.queue.popleft()
             server.is_busy = True
             server.current_agent = next_agent
             next_agent.service_start_time = current_time
             next_agent.server_id = server.server_id
             service_time = self.generate_service_time()
             next_agent.departure_time = current_time + service_time
-            heapq.heappush(self.event_queue, (next_agent.departure_time, 'departure', next_agent))
+            self.event_queue.push(next_agent.departure_time, DEPARTURE, next_agent, self.queue_id)
+        else:
+            self.free_servers.release(server.server_id)
+        self.stats.departure(current_time, len(self.queue), self.busy_servers())
 
-    def update_statistics(self, current_time):
-        time_diff = current_time - self.last_event_time
-        self.total_time_in_system += time_diff * len(self.queue)
-        self.total_time_in_queue += time_diff * max(0, len(self.queue) - self.num_servers)
-        self.total_time_in_service += time_diff * min(len(self.queue), self.num_servers)
-        self.last_event_time = current_time
+    def busy_servers(self):
+        return self.num_servers - len(self.free_servers)
 
     def calculate_statistics(self, current_time):
-        self.update_statistics(current_time)
-        total_time = current_time
-        L = self.total_time_in_system / total_time if total_time > 0 else 0
-        L_q = self.total_time_in_queue / total_time if total_time > 0 else 0
-        L_s = self.total_time_in_service / total_time if total_time > 0 else 0
-        W = L / self.arrival_rate if self.arrival_rate > 0 else 0
-        W_q = L_q / self.arrival_rate if self.arrival_rate > 0 else 0
-        W_s = L_s / self.arrival_rate if self.arrival_rate > 0 else 0
-        
-        return {
-            'L': L,
-            'L_q': L_q,
-            'L_s': L_s,
-            'W': W,
-            'W_q': W_q,
-            'W_s': W_s,
-            'Blocked customers': self.blocked_customers,
-            'Total arrivals': self.total_arrivals,
-            'Total departures': self.total_departures
-        }
+        """
+        Time-weighted statistics from 0 to current_time, W through Little's law with the measured throughput
+        """
+        return self.stats.report(current_time)
 
 class QueueAnimator:
     def __init__(self, max_time, num_queues):
@@ -148,7 +146,7 @@ class QueueAnimator:
 
     def update(self, frame, queues):
         for i, queue in enumerate(queues):
-            times, lengths = zip(*queue.queue_length_data)
+            times, lengths = queue.queue_length_data.arrays()
             self.lines[i].set_data(times[:frame], lengths[:frame])
             self.axs[i].set_title(f'Queue {i} Length')
             self.axs[i].relim()
@@ -163,11 +161,21 @@ class QueueAnimator:
         plt.show(block=False)
 
 class JacksonNetwork:
-    def __init__(self, num_queues, arrival_rates, service_rates, routing_probabilities, max_time, num_servers, max_queue_lengths):
-        self.queues = [MMmQueue(arrival_rates[i], service_rates[i], max_time, num_servers[i], max_queue_lengths[i]) for i in range(num_queues)]
+    def __init__(self, num_queues, arrival_rates, service_rates, routing_probabilities, max_time, num_servers, max_queue_lengths, event_list='heap', seed=None, stopping=None):
+        # stopping: stopping.SequentialStopping, ends the run before max_time once its intervals are tight enough
+        self.stopping = stopping
+        self.streams = RandomStreams(seed)  # seed=None follows np.random.seed()
+        self.routing_streams = [self.streams.uniform(ROUTING, i) for i in range(num_queues)]
+        self.routing = RoutingTable(routing_probabilities)  # alias tables compiled once
+        self.queues = [MMmQueue(arrival_rates[i], service_rates[i], max_time, num_servers[i], max_queue_lengths[i], event_list, queue_id=i, streams=self.streams) for i in range(num_queues)]
         self.routing_probabilities = routing_probabilities
         self.max_time = max_time
-        self.event_queue = []
+        self.event_queue = make_event_list(event_list)
+        self.agent_pool = AgentPool()  # Recycles the agents that left the network
+        # The stations schedule their departures on the network's event list and recycle the agents they reject
+        for queue in self.queues:
+            queue.event_queue = self.event_queue
+            queue.agent_pool = self.agent_pool
         self.time = 0
         self.agent_counter = 0
         self.animator = QueueAnimator(max_time, num_queues)
@@ -176,31 +184,45 @@ class JacksonNetwork:
         for i, queue in enumerate(self.queues):
             arrival_time = queue.generate_interarrival_time()
             self.agent_counter += 1
-            agent = Agent(arrival_time, self.agent_counter, [i])
-            heapq.heappush(self.event_queue, (arrival_time, 'arrival', agent, i))
+            agent = self.agent_pool.acquire(arrival_time, self.agent_counter)
+            agent.queue_path.append(i)
+            self.event_queue.push(arrival_time, ARRIVAL, agent, i)
 
+        stopping = self.stopping
+        if stopping is not None:
+            stopping.start()
+        events = 0
         while self.event_queue:
-            self.time, event_type, agent, queue_index = heapq.heappop(self.event_queue)
+            self.time, event_type, _, agent, queue_index = self.event_queue.pop()
             if self.time > self.max_time:
                 break
 
-            if event_type == 'arrival':
+            if event_type == ARRIVAL:
                 self.handle_arrival(agent, queue_index)
-            elif event_type == 'departure':
+            elif event_type == DEPARTURE:
                 self.handle_departure(agent, queue_index)
 
+            events += 1
+            if stopping is not None and events % stopping.check_every == 0 and stopping.check(self, events):
+                break
+
         # Add final data point for each queue
         for queue in self.queues:
-            queue.queue_length_data.append((self.max_time, len(queue.queue)))
+            queue.queue_length_data.append(self.end_time(), len(queue.queue))
 
     def handle_arrival(self, agent, queue_index):
         queue = self.queues[queue_index]
+        routed = len(agent.queue_path) > 1  # read before a blocked agent goes back to the pool
         queue.handle_arrival(agent, self.time)
+        if routed:
+            # routed from another queue, the external arrival stream of this queue is already scheduled
+            return
         next_arrival_time = self.time + queue.generate_interarrival_time()
         if next_arrival_time <= self.max_time:
             self.agent_counter += 1
-            next_agent = Agent(next_arrival_time, self.agent_counter, [queue_index])
-            heapq.heappush(self.event_queue, (next_arrival_time, 'arrival', next_agent, queue_index))
+            next_agent = self.agent_pool.acquire(next_arrival_time, self.agent_counter)
+            next_agent.queue_path.append(queue_index)
+            self.event_queue.push(next_arrival_time, ARRIVAL, next_agent, queue_index)
 
     def handle_departure(self, agent, queue_index):
         queue = self.queues[queue_index]
@@ -209,16 +231,33 @@ class JacksonNetwork:
         next_queue = self.get_next_queue(queue_index)
         if next_queue is not None:
             agent.queue_path.append(next_queue)
-            arrival_time = self.time
-            heapq.heappush(self.event_queue, (arrival_time, 'arrival', agent, next_queue))
+            # the departure records of each station hold the time spent at that station only
+            agent.arrival_time = self.time
+            self.event_queue.push(agent.arrival_time, ARRIVAL, agent, next_queue)
+        else:
+            self.agent_pool.release(agent)
 
     def get_next_queue(self, current_queue):
-        probabilities = self.routing_probabilities[current_queue]
-        next_queue = np.random.choice(len(probabilities), p=probabilities)
-        return next_queue if next_queue != current_queue else None
+        next_queue = self.routing.sample(current_queue, self.routing_streams[current_queue].draw())
+        if next_queue is None or next_queue == current_queue or next_queue >= len(self.queues):
+            # The last column of a row is the exit
+            return None
+        return next_queue
+
+    def end_time(self):
+        # max_time, or the time the run was stopped at
+        if self.stopping is not None and self.stopping.reason is not None:
+            return self.time
+        return self.max_time
 
     def get_statistics(self):
-        return [queue.calculate_statistics(self.max_time) for queue in self.queues]
+        return [queue.calculate_statistics(self.end_time()) for queue in self.queues]
+
+    def get_truncated_statistics(self, batch_size=5):
+        """
+        Statistics of each queue without its warm-up, detected with MSER (see warmup.py)
+        """
+        return [recorder_reports(queue.agents_data, queue.num_servers, self.end_time(), batch_size) for queue in self.queues]
 
     def visualize_network(self):
         G = nx.DiGraph()
@@ -290,9 +329,10 @@ if __name__ == "__main__":
     # Print some debug information
     for i, queue in enumerate(network.queues):
         print(f"\nQueue {i} data points: {len(queue.queue_length_data)}")
-        print(f"First 5 data points: {queue.queue_length_data[:5]}")
-        print(f"Last 5 data points: {queue.queue_length_data[-5:]}")
-        print(f"Max queue length: {max(length for _, length in queue.queue_length_data)}")
+        times, lengths = queue.queue_length_data.arrays()
+        print(f"First 5 data points: {list(zip(times[:5], lengths[:5]))}")
+        print(f"Last 5 data points: {list(zip(times[-5:], lengths[-5:]))}")
+        print(f"Max queue length: {lengths.max()}")
 
     network.visualize_network()
     network.animator.animate(network.queues)
@@ -1,7 +1,18 @@
+import os
+import sys
 import numpy as np
-import heapq
+from collections import deque
 import matplotlib.pyplot as plt
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from events import ARRIVAL, DEPARTURE
+from event_list import make_event_list
+from server_pool import FreeServerPool
+from routing import RoutingTable
+from variates import ARRIVALS, SERVICE, ROUTING, RandomStreams
+from recorder import DepartureRecorder
+from tracing import REJECTION, INFO, NULL_TRACER, Tracer
+
 class Agent:
     def __init__(self, arrival_time, agent_id):
         """ 
@@ -58,12 +69,35 @@ class Queue:
     def __init__(self, queue_id, num_servers, service_rate, capacity=float('inf')):
         self.queue_id = queue_id
         self.servers = [Server(i) for i in range(num_servers)]
+        self.free_servers = FreeServerPool(num_servers)  # Ids of the idle servers
         self.service_rate = service_rate
-        self.queue = []  # Queue of agents waiting to be served
+        self.queue = deque()  # Queue of agents waiting to be served
         self.capacity = capacity  # Maximum capacity of the queue
 
 class OpenQueueNetwork:
-    def __init__(self, arrival_rate, service_rates, max_time, num_servers, prob_matrix, capacities=None):
+    """
+    Open queueing network with a finite waiting room at each queue.
+    An agent that finds the waiting room of a queue full is rejected.
+
+    Parameters:
+    arrival_rate: external arrival rate at queue 0
+    service_rates: list of the service rate of each queue
+    max_time: The max simulation time
+    num_servers: list of the number of servers of each queue
+    prob_matrix: routing matrix. An agent routed back to the queue it just left leaves the network,
+                 and so does the mass missing from a row (1 - sum of the row)
+    capacities: list of the waiting room of each queue. Default: infinite
+    event_list: The pending-event set backend, 'heap', 'calendar' or 'ladder'
+    seed: int or numpy SeedSequence of the random streams.
+          None derives it from np.random, so np.random.seed() keeps runs reproducible
+    tracer: tracing.Tracer of the arrivals, departures and rejections. Default: tracing off
+
+    Events are (time, event_code, seq, agent_id, queue_id) records, the agent
+    itself is looked up by id in live_agents, which holds the agents in the
+    network and drops them when they leave it or are rejected.
+    """
+    def __init__(self, arrival_rate, service_rates, max_time, num_servers, prob_matrix, capacities=None,
+                 event_list='heap', seed=None, tracer=None):
         self.arrival_rate = arrival_rate
         self.service_rates = service_rates
         self.time = 0 
@@ -71,51 +105,61 @@ class OpenQueueNetwork:
         self.num_servers = num_servers
         self.prob_matrix = prob_matrix
         self.queues = [Queue(i, num_servers[i], service_rates[i], capacities[i] if capacities else float('inf')) for i in range(len(num_servers))]
-        self.event_queue = []  
-        self.agents_data = [] 
+        self.streams = RandomStreams(seed)
+        self.interarrival_stream = self.streams.exponential(arrival_rate, ARRIVALS)
+        self.service_streams = [self.streams.exponential(service_rates[i], SERVICE, i) for i in range(len(num_servers))]
+        self.routing_streams = [self.streams.uniform(ROUTING, i) for i in range(len(num_servers))]
+        self.routing = RoutingTable(prob_matrix)  # alias tables compiled once
+        self.event_queue = make_event_list(event_list)
+        self.agents_data = DepartureRecorder()  # departure records, one row per departure
+        self.live_agents = {}  # agent_id -> Agent, for the agents in the network
         self.agent_counter = 0
         self.rejected_agents = []  # List to store rejected agents
+        # Tracing flags are looked up once, the handlers only check the booleans
+        self.tracer = tracer if tracer is not None else NULL_TRACER
+        self.trace_arrivals = self.tracer.enabled(ARRIVAL)
+        self.trace_departures = self.tracer.enabled(DEPARTURE)
+        self.trace_rejections = self.tracer.enabled(REJECTION)
         self.arrival = 0
         self.departure = sum(num_servers) + 1
         self.agents = Agent(self.time, self.agent_counter)  # Initialize agent
 
     def schedule_next_arrival(self):
-        inter_arrival_time = np.random.exponential(1 / self.arrival_rate)
+        inter_arrival_time = self.interarrival_stream.draw()
         next_arrival_time = self.time + inter_arrival_time
         if next_arrival_time <= self.max_time:
-            heapq.heappush(self.event_queue, (next_arrival_time, self.arrival, self.agent_counter))
+            self.event_queue.push(next_arrival_time, ARRIVAL, self.agent_counter, 0)
             self.agent_counter += 1
 
     def handle_arrival(self, agent, queue_id):
         queue = self.queues[queue_id]
         agent.queue_length_on_arrival = len(queue.queue)
-        free_server = next((server for server in queue.servers if not server.is_busy), None)
+        free_server_id = queue.free_servers.acquire()
         
-        if free_server:
+        if free_server_id is not None:
             # Assign the agent to the free server
-            self.assign_server(free_server, agent, queue_id)
+            self.assign_server(queue.servers[free_server_id], agent, queue_id)
         else:
             # Check if the queue has reached its capacity
             if len(queue.queue) < queue.capacity:
                 # All servers are busy, so the agent joins the queue
                 queue.queue.append(agent)
             else:
-                print(f"Queue {queue_id} is full. Agent {agent.agent_id} is rejected.")
-                # Optionally handle the rejected agent (e.g., log it or count it)
+                if self.trace_rejections:
+                    self.tracer.emit(REJECTION, self.time, agent.agent_id, queue_id)
+                # The rejected agent leaves the network
                 self.rejected_agents.append(agent)
-        
-        # Schedule next arrival if it's in the initial queue
-        if queue_id == 0:
-            self.schedule_next_arrival()
+                del self.live_agents[agent.agent_id]
             
-        print(f"Arrival - Time: {self.time}, Agent ID: {agent.agent_id}, Assigned Server: {agent.server_id}, Queue ID: {queue_id}")
+        if self.trace_arrivals:
+            self.tracer.emit(ARRIVAL, self.time, agent.agent_id, queue_id, agent.server_id)
 
     def log_departure(self, agent, queue_id):
         """
         log agent's data along with queue_id.
         It is used for statistical calculations
         """
-        self.agents_data.append([
+        self.agents_data.record(
             agent.agent_id,
             agent.arrival_time,
             agent.service_start_time,
@@ -123,7 +167,7 @@ class OpenQueueNetwork:
             agent.server_id,
             queue_id,
             agent.queue_length_on_arrival
-        ])
+        )
 
 
     def handle_departure(self, agent, queue_id):
@@ -136,44 +180,52 @@ class OpenQueueNetwork:
         
         if queue.queue:
             # Serve the next agent in the queue
-            next_agent = queue.queue.pop(0)
+            next_agent = queue.queue.popleft()
             self.assign_server(server, next_agent, queue_id)
+        else:
+            queue.free_servers.release(server.server_id)
         
+        if self.trace_departures:
+            self.tracer.emit(DEPARTURE, self.time, agent.agent_id, queue_id, agent.server_id)
+
         # Move agent to the next queue if applicable
-        next_queue_id = np.random.choice(range(len(self.prob_matrix[queue_id])), p=self.prob_matrix[queue_id])
-        if next_queue_id != queue_id:
+        next_queue_id = self.routing.sample(queue_id, self.routing_streams[queue_id].draw())
+        if next_queue_id is None or next_queue_id == queue_id:
+            # The agent leaves the network, a move back to its own queue counts as leaving
+            del self.live_agents[agent.agent_id]
+        else:
+            agent.arrival_time = self.time
+            agent.server_id = None
             self.handle_arrival(agent, next_queue_id)
-        
-        print(f"Departure - Time: {self.time}, Agent ID: {agent.agent_id}, Server ID: {agent.server_id}, Queue ID: {queue_id}")
 
     def assign_server(self, server, agent, queue_id):
         server.is_busy = True
         agent.service_start_time = self.time
-        service_time = np.random.exponential(1 / self.service_rates[queue_id])
-        agent.service_end_time = self.time + service_time
+        service_time = self.service_streams[queue_id].draw()
+        agent.departure_time = self.time + service_time
         agent.server_id = server.server_id
-        heapq.heappush(self.event_queue, (agent.service_end_time, self.departure, agent.agent_id))
+        self.event_queue.push(agent.departure_time, DEPARTURE, agent.agent_id, queue_id)
 
     def simulate(self):
         self.schedule_next_arrival()
         
         while self.event_queue and self.time <= self.max_time:
-            self.time, event_type, agent_id = heapq.heappop(self.event_queue)
+            self.time, event_type, _, agent_id, queue_id = self.event_queue.pop()
             
-            if event_type == self.arrival:
+            if event_type == ARRIVAL:
                 agent = Agent(self.time, agent_id)
-                self.agents_data.append(agent)
-                self.handle_arrival(agent, 0)
-            elif event_type == self.departure:
-                agent = next(agent for agent in self.agents_data if agent.agent_id == agent_id)
-                queue_id = next(queue.queue_id for queue in self.queues if any(server.server_id == agent.server_id for server in queue.servers))
-                self.handle_departure(agent, queue_id)
+                self.live_agents[agent_id] = agent
+                self.handle_arrival(agent, queue_id)
+                # only an agent from outside the network brings the next external arrival
+                self.schedule_next_arrival()
+            elif event_type == DEPARTURE:
+                self.handle_departure(self.live_agents[agent_id], queue_id)
         
-        return np.array(self.agents_data)
+        return self.agents_data.data()
 
     def visualize(self):
         # Convert data to a numpy array for easier handling
-        data = np.array(self.agents_data)
+        data = self.agents_data.data()
 
         # agent_ids = data[:, 0]
         # arrival_times = data[:, 1]
@@ -204,7 +256,7 @@ if __name__=="__main__":
     capacities = [10, 10, 10]  # Set capacities for each queue
 
     np.random.seed(2)
-    network = OpenQueueNetwork(arrival_rate, service_rates, max_time, num_servers, prob_matrix, capacities)
+    network = OpenQueueNetwork(arrival_rate, service_rates, max_time, num_servers, prob_matrix, capacities, tracer=Tracer(INFO))
     agents_data = network.simulate()
     
     print(agents_data)
@@ -1,7 +1,20 @@
+import os
+import sys
 import numpy as np
-import heapq
+from collections import deque
 import matplotlib.pyplot as plt
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from events import ARRIVAL, DEPARTURE
+from event_list import make_event_list
+from server_pool import FreeServerPool
+from agent_pool import AgentPool
+from routing import RoutingTable
+from variates import ARRIVALS, SERVICE, ROUTING, RandomStreams
+from tracing import NULL_TRACER
+from recorder import DepartureRecorder
+from tandem import is_tandem, simulate_series
+
 class Agent:
     def __init__(self, arrival_time, agent_id):
         """ 
@@ -62,23 +75,29 @@ class Queue:
     queue_id: The current id of the queue
     num_servers: The number of servers
     service_rate: The service rate of the servers
+    service_stream: VariateStream of the service times. Default: an unseeded stream
 
     Returns:
     Attributes of the queue
     servers: A list of the attributes for each server
-    queue: empty list- agents that find the server occupied joins the queue
+    free_servers: FreeServerPool- ids of the idle servers
+    queue: empty deque- agents that find the server occupied joins the queue (O(1) append and popleft)
     generate_service_time: A service time for the agent following an exponential distribution 
     """
     
-    def __init__(self, queue_id, num_servers, service_rate):
+    def __init__(self, queue_id, num_servers, service_rate, service_stream=None):
         self.queue_id = queue_id
         self.servers = [Server(i) for i in range(num_servers)]
+        self.free_servers = FreeServerPool(num_servers)
         self.service_rate = service_rate
-        self.queue = []  # Queue of agents waiting to be served
+        self.queue = deque()  # Queue of agents waiting to be served
+        if service_stream is None:
+            service_stream = RandomStreams().exponential(service_rate, SERVICE, queue_id, decimals=3)
+        self.service_stream = service_stream
 
     def generate_service_time(self):
         # Generate service time using exponential distribution
-        return round(np.random.exponential(1.0 / self.service_rate),3)
+        return self.service_stream.draw()
 
 
 class OpenQueueNetwork:
@@ -91,6 +110,15 @@ class OpenQueueNetwork:
     max_time: The max simulation time
     num_servers: The number of servers in the system
     prob_matrix: A transition matrix that describes the movement of agents from queue's
+    event_list: The pending-event set backend, 'heap', 'calendar' or 'ladder'
+    seed: int or numpy SeedSequence of the random streams.
+          None derives it from np.random, so np.random.seed() keeps runs reproducible
+    tracer: tracing.Tracer of the arrivals and departures. Default: tracing off
+    fast_path: if True and the network is a tandem line of single-server stations (see tandem.is_tandem),
+               simulate() computes agents_data with the vectorised Lindley recursion of tandem.py
+               instead of running the events. Tracing, if enabled, keeps the event simulation
+    stopping: stopping.SequentialStopping, ends the run before max_time once its confidence intervals are
+              tight enough. Default: run to max_time
 
     Attributes:
     arrival_rate: int or float
@@ -100,25 +128,39 @@ class OpenQueueNetwork:
     prob_matrix: array
     queues: A list of class Queues.
             The length of queues is the length of the num_servers
+    streams: RandomStreams- interarrival, service and routing streams
     time: initialize time
-    event_queue: list- queue event handler
-    agents_data: list- store data about each agent
+    event_queue: event list- queue event handler, holds (time, event_code, seq, agent, queue_id) records
+    agents_data: DepartureRecorder- one row per departure, columns recorder.AGENT_COLUMNS
     agent_counter: int- counter for generating unique id for the agent
+    agent_pool: AgentPool- recycles the agents that left the network
+    trace_arrivals, trace_departures: bool- cached from the tracer, checked on every event
     master_queue: list- used for plotting graph network
     agents: Initialize Agent class  
     """
 
-    def __init__(self, arrival_rate, service_rates, max_time, num_servers, prob_matrix):
+    def __init__(self, arrival_rate, service_rates, max_time, num_servers, prob_matrix, event_list='heap', seed=None, tracer=None, fast_path=False, stopping=None):
         self.arrival_rate = arrival_rate
         self.service_rates = service_rates
         self.time = 0 
         self.max_time = max_time
         self.num_servers = num_servers
         self.prob_matrix = prob_matrix
-        self.queues = [Queue(i, num_servers[i], service_rates[i]) for i in range(len(num_servers))]
-        self.event_queue = []  
-        self.agents_data = [] 
+        self.streams = RandomStreams(seed)
+        self.interarrival_stream = self.streams.exponential(arrival_rate, ARRIVALS, decimals=3)
+        self.routing_streams = [self.streams.uniform(ROUTING, i) for i in range(len(num_servers))]
+        self.routing = RoutingTable(prob_matrix)  # alias tables compiled once
+        self.queues = [Queue(i, num_servers[i], service_rates[i], self.streams.exponential(service_rates[i], SERVICE, i, decimals=3))
+                       for i in range(len(num_servers))]
+        self.event_queue = make_event_list(event_list)
+        self.agents_data = DepartureRecorder()  # departure records, one row per departure
         self.agent_counter = 0
+        self.agent_pool = AgentPool()
+        self.tracer = tracer if tracer is not None else NULL_TRACER
+        self.trace_arrivals = self.tracer.enabled(ARRIVAL)
+        self.trace_departures = self.tracer.enabled(DEPARTURE)
+        self.fast_path = fast_path
+        self.stopping = stopping
 
         """
         plotting network queue
@@ -135,6 +177,10 @@ class OpenQueueNetwork:
         self.arrival = 0
         self.departure = sum(num_servers) + 1
         self.agents = Agent(self.time,self.agent_counter) #initialize agent
+
+    def generate_interarrival_time(self):
+        # Generate interarrival time using exponential distribution
+        return self.interarrival_stream.draw()
     
     def advance_time(self):
         """
@@ -142,7 +188,7 @@ class OpenQueueNetwork:
         Additionally, it ensures the current time does not exceed the maximum simulation time
         """
         if self.event_queue:
-            self.time, event_type, agent, queue_id = heapq.heappop(self.event_queue)
+            self.time, event_type, _, agent, queue_id = self.event_queue.pop()
             if self.time > self.max_time:
                 return False, None, None, None
             return True, event_type, agent, queue_id
@@ -168,17 +214,17 @@ class OpenQueueNetwork:
         agent.server_id = server.server_id
         service_time = self.queues[queue_id].generate_service_time()
         agent.departure_time = self.time + service_time
-        heapq.heappush(self.event_queue, (agent.departure_time, 'departure', agent, queue_id))
+        self.event_queue.push(agent.departure_time, DEPARTURE, agent, queue_id)
 
     def schedule_next_arrival(self):
         """
         Schedules the next arrival
         """
 
-        next_arrival_time = self.time + self.agents.generate_interarrival_time(self.arrival_rate)
+        next_arrival_time = self.time + self.generate_interarrival_time()
         self.agent_counter += 1
-        new_agent = Agent(next_arrival_time, self.agent_counter)
-        heapq.heappush(self.event_queue, (next_arrival_time, 'arrival', new_agent, 0))
+        new_agent = self.agent_pool.acquire(next_arrival_time, self.agent_counter)
+        self.event_queue.push(next_arrival_time, ARRIVAL, new_agent, 0)
     
     def handle_arrival(self, agent, queue_id):
         """
@@ -197,11 +243,11 @@ class OpenQueueNetwork:
         # Handle the arrival of an agent at a specific queue
         queue = self.queues[queue_id] 
         agent.queue_length_on_arrival = len(queue.queue)
-        free_server = next((server for server in queue.servers if not server.is_busy), None)
+        free_server_id = queue.free_servers.acquire()
         
-        if free_server:
+        if free_server_id is not None:
             # Assign the agent to the free server
-            self.assign_server(free_server, agent, queue_id)  
+            self.assign_server(queue.servers[free_server_id], agent, queue_id)  
         else:
             # All servers are busy, so the agent joins the queue
             queue.queue.append(agent)
@@ -210,7 +256,8 @@ class OpenQueueNetwork:
         if queue_id == 0:
             self.schedule_next_arrival()
             
-        print(f"Arrival - Time: {self.time}, Agent ID: {agent.agent_id}, Assigned Server: {agent.server_id}, Queue ID: {queue_id}")
+        if self.trace_arrivals:
+            self.tracer.emit(ARRIVAL, self.time, agent.agent_id, queue_id, agent.server_id)
         
     
     def log_departure(self, agent, queue_id):
@@ -218,7 +265,7 @@ class OpenQueueNetwork:
         log agent's data along with queue_id.
         It is used for statistical calculations
         """
-        self.agents_data.append([
+        self.agents_data.record(
             agent.agent_id,
             agent.arrival_time,
             agent.service_start_time,
@@ -226,7 +273,7 @@ class OpenQueueNetwork:
             agent.server_id,
             queue_id,
             agent.queue_length_on_arrival
-        ])
+        )
 
     def handle_departure(self, agent, queue_id):
         """
@@ -248,12 +295,15 @@ class OpenQueueNetwork:
         
         if queue.queue:
             # Start service for the next agent in queue
-            next_agent = queue.queue.pop(0)
+            next_agent = queue.queue.popleft()
             self.assign_server(server, next_agent, queue_id)
+        else:
+            queue.free_servers.release(server.server_id)
             
         
         # Determine the next queue for the agent based on the probability matrix
         # check the current q is the last q. If it is then we do not schedule arrival
+        next_queue_id = None
         if queue_id != len(self.prob_matrix) - 1:
             next_queue_id = self.next_queue(queue_id)
             if next_queue_id is not None:
@@ -262,48 +312,67 @@ class OpenQueueNetwork:
                 # Remap the server ID if moving to a different stage
                 if next_queue_id != queue_id:
                     agent.server_id = None  # Reset the server ID as it will be reassigned in the next stage
-                heapq.heappush(self.event_queue, (next_arrival_time, 'arrival', agent, next_queue_id))
+                self.event_queue.push(next_arrival_time, ARRIVAL, agent, next_queue_id)
         
-        print(f"Departure - Time: {self.time}, Agent ID: {agent.agent_id}, Released Server: {agent.server_id}, Queue ID: {queue_id}")  
+        if self.trace_departures:
+            self.tracer.emit(DEPARTURE, self.time, agent.agent_id, queue_id, agent.server_id)
+
+        if next_queue_id is None:
+            # The agent left the network
+            self.agent_pool.release(agent)
     
     def next_queue(self, current_queue_id):
         """
-        Determine the next queue based on the probability matrix given current_queue
+        Determine the next queue based on the probability matrix given current_queue.
+        Probability mass missing from the row (1 - sum of the row) leaves the network
         """
         
-        probabilities = self.prob_matrix[current_queue_id]
-        next_queue_id = np.random.choice(len(probabilities), p=probabilities)
-        return next_queue_id if next_queue_id != len(probabilities) else None
+        return self.routing.sample(current_queue_id, self.routing_streams[current_queue_id].draw())
     
     def simulate(self):
         """
         Simulates the network and also schedules the first arrival. 
         """
+        if (self.fast_path and not (self.trace_arrivals or self.trace_departures) and self.stopping is None
+                and is_tandem(self.prob_matrix, self.num_servers)):
+            # same streams, same records, no events
+            self.agents_data.extend(simulate_series(self.arrival_rate, self.service_rates, self.max_time,
+                                                    self.streams.seed))
+            return self.agents_data.data()
+
         # Schedule the first arrival
-        arrival_time = self.agents.generate_interarrival_time(self.arrival_rate)
+        arrival_time = self.generate_interarrival_time()
         self.agent_counter += 1  # Generate a unique ID for each agent
-        agent = Agent(arrival_time, self.agent_counter)
+        agent = self.agent_pool.acquire(arrival_time, self.agent_counter)
 
         initial_queue_id = 0  # Assuming the first agent starts at queue 0 #need to change this to stage_id
-        heapq.heappush(self.event_queue, (arrival_time, 'arrival', agent, initial_queue_id))
-        
+        self.event_queue.push(arrival_time, ARRIVAL, agent, initial_queue_id)
+
+        stopping = self.stopping
+        if stopping is not None:
+            stopping.start()
+        events = 0
         while True:
             continue_simulation, event_type, agent, queue_id = self.advance_time()
             if not continue_simulation:
                 break
             
-            if event_type == 'arrival':
+            if event_type == ARRIVAL:
                 self.handle_arrival(agent, queue_id)
                 
 
-            elif event_type == 'departure':
+            elif event_type == DEPARTURE:
                 self.handle_departure(agent, queue_id)
 
-        return np.array(self.agents_data)
+            events += 1
+            if stopping is not None and events % stopping.check_every == 0 and stopping.check(self, events):
+                break
+
+        return self.agents_data.data()
 
     def visualize(self):
         # Convert data to a numpy array for easier handling
-        data = np.array(self.agents_data)
+        data = self.agents_data.data()
         agent_ids = data[:, 0]
         arrival_times = data[:, 1]
         service_start_times = data[:, 2]
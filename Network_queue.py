@@ -1,6 +1,9 @@
 import numpy as np
+from collections import deque
 import heapq
 import matplotlib.pyplot as plt
+from server_pool import FreeServerPool
+from recorder import DepartureRecorder
 
 class Agent:
     def __init__(self, arrival_time, agent_id):
@@ -24,8 +27,9 @@ class Queue:
     def __init__(self, queue_id, num_servers, service_rate):
         self.queue_id = queue_id
         self.servers = [Server(i) for i in range(num_servers)]
+        self.free_servers = FreeServerPool(num_servers)  # Ids of the idle servers
         self.service_rate = service_rate
-        self.queue = []  # Queue of agents waiting to be served
+        self.queue = deque()  # Queue of agents waiting to be served
 
     def generate_service_time(self):
         # Generate service time using exponential distribution
@@ -41,7 +45,7 @@ class ClosedQueueNetwork:
         self.queues = [Queue(i, num_servers[i], service_rates[i]) for i in range(len(num_servers))]
         self.time = 0  # Current simulation time
         self.event_queue = []  # Priority queue for managing events
-        self.agents_data = []  # List to store data about each agent
+        self.agents_data = DepartureRecorder(('agent_id', 'queue_id', 'arrival', 'service_start', 'departure', 'queue_length_on_arrival', 'server_id'))  # departure records, one row per departure
         self.agent_counter = 0  # Counter for generating unique agent IDs
     
     def generate_interarrival_time(self):
@@ -61,7 +65,8 @@ class ClosedQueueNetwork:
         # Handle the arrival of an agent at a specific queue
         queue = self.queues[queue_id]
         agent.queue_length_on_arrival = len(queue.queue)
-        free_server = next((server for server in queue.servers if not server.is_busy), None)
+        free_server_id = queue.free_servers.acquire()
+        free_server = queue.servers[free_server_id] if free_server_id is not None else None
         if free_server:
             # Assign the agent to the free server
             free_server.is_busy = True
@@ -78,7 +83,7 @@ class ClosedQueueNetwork:
     def handle_departure(self, agent, queue_id):
         # Handle the departure of an agent from a specific queue
         queue = self.queues[queue_id]
-        self.agents_data.append([
+        self.agents_data.record(
             agent.agent_id,
             queue_id,
             agent.arrival_time,
@@ -86,7 +91,7 @@ class ClosedQueueNetwork:
             agent.departure_time,
             agent.queue_length_on_arrival,
             agent.server_id
-        ])
+        )
         
         server = queue.servers[agent.server_id]
         server.is_busy = False
@@ -94,7 +99,7 @@ class ClosedQueueNetwork:
         
         if queue.queue:
             # Start service for the next agent in queue
-            next_agent = queue.queue.pop(0)
+            next_agent = queue.queue.popleft()
             server.is_busy = True
             server.current_agent = next_agent
             next_agent.service_start_time = self.time
@@ -102,6 +107,8 @@ class ClosedQueueNetwork:
             service_time = queue.generate_service_time()
             next_agent.departure_time = self.time + service_time
             heapq.heappush(self.event_queue, (next_agent.departure_time, 'departure', next_agent, queue_id))
+        else:
+            queue.free_servers.release(server.server_id)
         
         # Determine the next queue for the agent based on the probability matrix
         next_queue_id = self.next_queue(queue_id)
@@ -135,11 +142,11 @@ class ClosedQueueNetwork:
             elif event_type == 'departure':
                 self.handle_departure(agent, queue_id)
 
-        return np.array(self.agents_data)
+        return self.agents_data.data()
 
     def visualize(self):
         # Convert data to a numpy array for easier handling
-        data = np.array(self.agents_data)
+        data = self.agents_data.data()
         agent_ids = data[:, 0]
         queue_ids = data[:, 1]
         arrival_times = data[:, 2]
@@ -1,6 +1,14 @@
 import numpy as np
-import heapq
+from collections import deque
 import matplotlib.pyplot as plt
+from events import ARRIVAL, DEPARTURE
+from event_list import make_event_list
+from server_pool import FreeServerPool
+from agent_pool import AgentPool
+from routing import RoutingTable
+from variates import ARRIVALS, SERVICE, ROUTING, RandomStreams
+from node_index import NodeIndex
+from recorder import DepartureRecorder
 
 class Agent:
     def __init__(self, arrival_time, agent_id):
@@ -21,37 +29,49 @@ class Server:
         self.current_agent = None
 
 class Queue:
-    def __init__(self, queue_id, num_servers, service_rate):
+    def __init__(self, queue_id, num_servers, service_rate, service_stream=None):
         self.queue_id = queue_id
         self.servers = [Server(i) for i in range(num_servers)]
+        self.free_servers = FreeServerPool(num_servers)
         self.service_rate = service_rate
-        self.queue = []
+        self.queue = deque()
+        if service_stream is None:
+            service_stream = RandomStreams().exponential(service_rate, SERVICE, queue_id, decimals=3)
+        self.service_stream = service_stream
 
     def generate_service_time(self):
-        return round(np.random.exponential(1.0 / self.service_rate), 3)
+        return self.service_stream.draw()
 
 class OpenQueueNetwork:
-    def __init__(self, arrival_rate, service_rates, max_time, num_servers, prob_matrix):
+    def __init__(self, arrival_rate, service_rates, max_time, num_servers, prob_matrix, event_list='heap', seed=None):
         self.arrival_rate = arrival_rate
         self.service_rates = service_rates
         self.max_time = max_time
         self.num_servers = num_servers
         self.prob_matrix = prob_matrix
-        self.queues = [Queue(i, num_servers[i], service_rates[i]) for i in range(len(num_servers))]
+        self.streams = RandomStreams(seed)  # seed=None follows np.random.seed()
+        self.interarrival_stream = self.streams.exponential(arrival_rate, ARRIVALS, decimals=3)
+        self.routing_streams = [self.streams.uniform(ROUTING, i) for i in range(len(num_servers))]
+        self.routing = RoutingTable(prob_matrix)  # alias tables compiled once
+        self.queues = [Queue(i, num_servers[i], service_rates[i], self.streams.exponential(service_rates[i], SERVICE, i, decimals=3))
+                       for i in range(len(num_servers))]
         self.time = 0
-        self.event_queue = []
-        self.agents_data = []
+        self.event_queue = make_event_list(event_list)
+        self.agents_data = DepartureRecorder()  # departure records, one row per departure
         self.agent_counter = 0
+        self.agent_pool = AgentPool()  # Recycles the agents that left the network
         self.master_queue = [(0, "source", "target", "event_type")]
+        self.node_index = NodeIndex(num_servers)  # (stage, server) -> node id of the graph, built once
+        self.last_stage = len(num_servers) - 1
         self.arrival = 0
         self.departure = sum(num_servers) + 1
     
     def generate_interarrival_time(self):
-        return round(np.random.exponential(1.0 / self.arrival_rate), 3)
+        return self.interarrival_stream.draw()
     
     def advance_time(self):
         if self.event_queue:
-            self.time, event_type, agent, queue_id = heapq.heappop(self.event_queue)
+            self.time, event_type, _, agent, queue_id = self.event_queue.pop()
             if self.time > self.max_time:
                 return False, None, None, None
             return True, event_type, agent, queue_id
@@ -60,10 +80,10 @@ class OpenQueueNetwork:
     def handle_arrival(self, agent, queue_id):
         queue = self.queues[queue_id]
         agent.queue_length_on_arrival = len(queue.queue)
-        free_server = next((server for server in queue.servers if not server.is_busy), None)
+        free_server_id = queue.free_servers.acquire()
         
-        if free_server:
-            self.assign_server(free_server, agent, queue_id)
+        if free_server_id is not None:
+            self.assign_server(queue.servers[free_server_id], agent, queue_id)
         else:
             queue.queue.append(agent)
         
@@ -80,16 +100,20 @@ class OpenQueueNetwork:
         server.current_agent = None
         
         if queue.queue:
-            next_agent = queue.queue.pop(0)
+            next_agent = queue.queue.popleft()
             self.assign_server(server, next_agent, queue_id)
+        else:
+            queue.free_servers.release(server.server_id)
         
         next_queue_id = self.next_queue(queue_id)
         if next_queue_id is not None:
             agent.arrival_time = self.time
             agent.server_id = None
-            heapq.heappush(self.event_queue, (self.time, 'arrival', agent, next_queue_id))
+            self.event_queue.push(self.time, ARRIVAL, agent, next_queue_id)
         
         self.capture_event(agent, queue_id, 'departure')
+        if next_queue_id is None:
+            self.agent_pool.release(agent)
     
     def assign_server(self, server, agent, queue_id):
         server.is_busy = True
@@ -98,16 +122,16 @@ class OpenQueueNetwork:
         agent.server_id = server.server_id
         service_time = self.queues[queue_id].generate_service_time()
         agent.departure_time = self.time + service_time
-        heapq.heappush(self.event_queue, (agent.departure_time, 'departure', agent, queue_id))
+        self.event_queue.push(agent.departure_time, DEPARTURE, agent, queue_id)
     
     def schedule_next_arrival(self):
         next_arrival_time = self.time + self.generate_interarrival_time()
         self.agent_counter += 1
-        new_agent = Agent(next_arrival_time, self.agent_counter)
-        heapq.heappush(self.event_queue, (next_arrival_time, 'arrival', new_agent, 0))
+        new_agent = self.agent_pool.acquire(next_arrival_time, self.agent_counter)
+        self.event_queue.push(next_arrival_time, ARRIVAL, new_agent, 0)
     
     def log_departure(self, agent, queue_id):
-        self.agents_data.append([
+        self.agents_data.record(
             agent.agent_id,
             agent.arrival_time,
             agent.service_start_time,
@@ -115,48 +139,28 @@ class OpenQueueNetwork:
             agent.server_id,
             queue_id,
             agent.queue_length_on_arrival
-        ])
+        )
     
     def next_queue(self, current_queue_id):
-        probabilities = self.prob_matrix[current_queue_id]
-        next_queue_id = np.random.choice(len(probabilities), p=probabilities)
-        return next_queue_id if next_queue_id != len(probabilities) else None
+        # Probability mass missing from the row leaves the network
+        return self.routing.sample(current_queue_id, self.routing_streams[current_queue_id].draw())
     
     def capture_event(self, agent, queue_id, event_type):
-        Nodes = self.get_node()
+        node = self.node_index.node
         server_id = agent.server_id if agent.server_id is not None else 0
-        if queue_id == 0 and event_type == 'arrival':
-            source = Nodes[0]
-            target = Nodes[self.get_index_from_list(server_id, queue_id, self.num_servers)]
-        elif event_type == 'departure' and queue_id == len(self.num_servers) - 1:
-            source = Nodes[self.get_index_from_list(server_id, queue_id, self.num_servers)]
-            target = Nodes[-1]
+        if event_type == 'arrival':
+            # the agent comes from the source or from the previous stage
+            source = self.node_index.source if queue_id == 0 else node(queue_id - 1, server_id)
+            target = node(queue_id, server_id)
+        elif queue_id == self.last_stage:
+            source = node(queue_id, server_id)
+            target = self.node_index.sink
         else:
-            source = Nodes[self.get_index_from_list(server_id, queue_id, self.num_servers)]
-            target = Nodes[self.get_index_from_list(server_id, queue_id + 1, self.num_servers)]
+            source = node(queue_id, server_id)
+            target = node(queue_id + 1, server_id)
         
         self.master_queue.append([self.time, source, target, event_type])
     
-    def get_node(self):
-        Nodes = [0]
-        current_node_index = 1
-        for stage, num_servers in enumerate(self.num_servers):
-            for _ in range(num_servers):
-                Nodes.append(current_node_index)
-                current_node_index += 1
-        Nodes.append(current_node_index)
-        return Nodes
-    
-    def get_index_from_list(self, worker_number, stage_number, num_servers):
-        offset = 1
-        for stage in range(stage_number):
-            offset += num_servers[stage]
-        index = offset + worker_number
-        total_servers = sum(num_servers)
-        if index < 1 or index > total_servers:
-            raise ValueError(f"Invalid index: {index}. Worker number: {worker_number}, Stage number: {stage_number}")
-        return index
-    
     def simulate(self):
         self.schedule_next_arrival()
         
@@ -165,15 +169,15 @@ class OpenQueueNetwork:
             if not continue_simulation:
                 break
             
-            if event_type == 'arrival':
+            if event_type == ARRIVAL:
                 self.handle_arrival(agent, queue_id)
-            elif event_type == 'departure':
+            elif event_type == DEPARTURE:
                 self.handle_departure(agent, queue_id)
                               
-        return np.array(self.agents_data), np.array(self.master_queue)
+        return self.agents_data.data(), np.array(self.master_queue)
 
     def visualize(self):
-        data = np.array(self.agents_data)
+        data = self.agents_data.data()
         plt.figure(figsize=(12, 6))
         for queue_id in np.unique(data[:, 5]):
             queue_data = data[data[:, 5] == queue_id]
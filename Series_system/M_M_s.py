@@ -1,8 +1,19 @@
+import os
+import sys
 import numpy as np
-import heapq
+from collections import deque
 import math
 import matplotlib.pyplot as plt
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from events import ARRIVAL, DEPARTURE
+from event_list import make_event_list
+from server_pool import FreeServerPool
+from variates import ARRIVALS, SERVICE, RandomStreams
+from station_stats import StationStatistics
+from recorder import DepartureRecorder
+from kiefer_wolfowitz import simulate_fcfs
+
 class Agent:
     def __init__(self, arrival_time, agent_id):
         self.arrival_time = arrival_time
@@ -22,18 +33,29 @@ class Server:
         self.current_agent = None
 
 class MMmQueue:
-    def __init__(self, arrival_rate, service_rate, max_time, num_servers, max_queue_length):
+    """
+    fast_path: if True and max_queue_length is infinite (no blocking), simulate() places the agents with the
+               Kiefer-Wolfowitz recursion of kiefer_wolfowitz.py instead of running the events. agents_data and
+               master_queue are the same for the same seed, the time-weighted statistics of get_statistics()
+               are only kept by the event simulation. A run with stopping keeps the event simulation
+    stopping: stopping.SequentialStopping, ends the run before max_time once its confidence intervals are
+              tight enough. Default: run to max_time
+    """
+    def __init__(self, arrival_rate, service_rate, max_time, num_servers, max_queue_length, event_list='heap', seed=None, fast_path=False, stopping=None):
         self.arrival_rate = arrival_rate
         self.service_rate = service_rate
         self.max_time = max_time
         self.num_servers = num_servers
-        self.queue = []  # Queue of agents waiting to be served
+        self.queue = deque()  # Queue of agents waiting to be served
         self.time = 0  # Current simulation time
-        self.event_queue = []  # Priority queue for managing events
-        self.agents_data = []  # List to store data about each agent
+        self.event_queue = make_event_list(event_list)  # Pending events ('heap', 'calendar' or 'ladder')
+        self.agents_data = DepartureRecorder(('arrival', 'service_start', 'departure', 'queue_length_on_arrival', 'server_id', 'agent_id'))  # departure records, one row per departure
         self.servers = [Server(i) for i in range(num_servers)]  # List of servers
+        self.free_servers = FreeServerPool(num_servers)  # Ids of the idle servers
         self.agent_counter = 0
         self.max_queue_length = max_queue_length
+        self.fast_path = fast_path
+        self.stopping = stopping
 
         self.master_queue = [(0, "Source", "Target", "l_queue")]
         self.arrival = 0 # this are number for data logging
@@ -44,19 +66,25 @@ class MMmQueue:
         self.total_customers = 0
         self.total_time_in_service = 0
         self.blocked_customer = 0
+        self.stats = StationStatistics(num_servers)  # time-weighted L, L_q, utilization, no history kept
+
+        # Buffered random streams, seed=None follows np.random.seed()
+        self.streams = RandomStreams(seed)
+        self.interarrival_stream = self.streams.exponential(arrival_rate, ARRIVALS, decimals=3)
+        self.service_stream = self.streams.exponential(service_rate, SERVICE, decimals=3)
     
     def generate_interarrival_time(self):
         # Generate interarrival time using exponential distribution
-        return round(np.random.exponential(1.0 / self.arrival_rate),3)
+        return self.interarrival_stream.draw()
     
     def generate_service_time(self):
         # Generate service time using exponential distribution
-        return round(np.random.exponential(1.0 / self.service_rate),3)
+        return self.service_stream.draw()
     
     def advance_time(self):
         # Advance the simulation time by processing the next event
         if self.event_queue:
-            self.time, event_type, agent = heapq.heappop(self.event_queue)
+            self.time, event_type, _, agent, _ = self.event_queue.pop()
             if self.time > self.max_time:
                 return False, None, None
             return True, event_type, agent
@@ -65,7 +93,8 @@ class MMmQueue:
     def handle_arrival(self, agent):
         # Handle the arrival of an agent
         agent.queue_length_on_arrival = len(self.queue)
-        free_server = next((server for server in self.servers if not server.is_busy), None)
+        free_server_id = self.free_servers.acquire()
+        free_server = self.servers[free_server_id] if free_server_id is not None else None
         if free_server:
             # Assign the agent to the free server
             free_server.is_busy = True
@@ -74,32 +103,36 @@ class MMmQueue:
             agent.server_id = free_server.server_id
             service_time = self.generate_service_time()
             agent.departure_time = self.time + service_time
-            heapq.heappush(self.event_queue, (agent.departure_time, 'departure', agent))
+            self.event_queue.push(agent.departure_time, DEPARTURE, agent)
+            blocked = False
         elif len(self.queue) <= (self.max_queue_length + self.num_servers):
             # All servers are busy, so the agent joins the queue
             self.queue.append(agent)   
+            blocked = False
         else:
             self.blocked_customer += 1  #need to verify this
+            blocked = True
+        self.stats.arrival(self.time, len(self.queue), self.num_servers - len(self.free_servers), blocked)
 
         # Schedule the next arrival if within max_time
         next_arrival_time = self.time + self.generate_interarrival_time()
         if next_arrival_time <= self.max_time:
             self.agent_counter += 1
             next_agent = Agent(next_arrival_time, self.agent_counter)
-            heapq.heappush(self.event_queue, (next_arrival_time, 'arrival', next_agent))
+            self.event_queue.push(next_arrival_time, ARRIVAL, next_agent)
         
         #print(f"This is event_queue: {self.event_queue}")
     
     def handle_departure(self, agent):
         # Handle the departure of an agent
-        self.agents_data.append([
+        self.agents_data.record(
             agent.arrival_time,
             agent.service_start_time,
             agent.departure_time,
             agent.queue_length_on_arrival,
             agent.server_id,
             agent.agent_id
-        ])
+        )
         
         server = self.servers[agent.server_id]
         server.is_busy = False
@@ -107,46 +140,71 @@ class MMmQueue:
         
         if self.queue:
             # Start service for the next agent in queue
-            next_agent = self.queue.pop(0)
+            next_agent = self.queue.popleft()
             server.is_busy = True
             server.current_agent = next_agent
             next_agent.service_start_time = self.time
             next_agent.server_id = server.server_id
             service_time = self.generate_service_time()
             next_agent.departure_time = self.time + service_time
-            heapq.heappush(self.event_queue, (next_agent.departure_time, 'departure', next_agent))
+            self.event_queue.push(next_agent.departure_time, DEPARTURE, next_agent)
+        else:
+            self.free_servers.release(server.server_id)
+        self.stats.departure(self.time, len(self.queue), self.num_servers - len(self.free_servers))
+
+    def get_statistics(self):
+        """
+        Time-weighted statistics of the run up to max_time, without going back over agents_data
+        """
+        return self.stats.report(min(self.time, self.max_time))
     
     def simulate(self):
+        if self.fast_path and math.isinf(self.max_queue_length) and self.stopping is None:
+            # same streams, same records, no events
+            data, rows = simulate_fcfs(self.arrival_rate, self.service_rate, self.max_time, self.num_servers,
+                                       self.streams.seed, events=True)
+            self.agents_data.extend(data)
+            columns = [rows[:, 0].astype(str)] + [rows[:, k].astype(np.int64).astype(str) for k in range(1, 4)]
+            master_queue = np.vstack((np.array(self.master_queue[0], dtype=str), np.column_stack(columns)))
+            return self.agents_data.data(), master_queue
+
         # Schedule the first arrival
         arrival_time = self.generate_interarrival_time()
         print(f"this is the first arrival: {arrival_time}")
         self.agent_counter += 1
         agent = Agent(arrival_time, self.agent_counter)
-        heapq.heappush(self.event_queue, (arrival_time, 'arrival', agent))
-        
+        self.event_queue.push(arrival_time, ARRIVAL, agent)
+
+        stopping = self.stopping
+        if stopping is not None:
+            stopping.start()
+        events = 0
         while True:
             continue_simulation, event_type, agent = self.advance_time()
             if not continue_simulation:
                 break
             
-            if event_type == 'arrival':
+            if event_type == ARRIVAL:
                 self.handle_arrival(agent)
                 if agent.server_id == None:
                     server_id = 1
                     self.master_queue.append([self.time, self.arrival, server_id, agent.queue_length_on_arrival])
                 else:
                     self.master_queue.append([self.time, self.arrival, agent.server_id + 1, agent.queue_length_on_arrival])
-            elif event_type == 'departure':
+            elif event_type == DEPARTURE:
                 self.handle_departure(agent)
                 self.master_queue.append([self.time, agent.server_id + 1, self.departure, 0])
-            
+
+            events += 1
+            if stopping is not None and events % stopping.check_every == 0 and stopping.check(self, events):
+                break
             #self.master_queue.append([self.time, event_type,  agent.server_id])
 
-        return np.array(self.agents_data), np.array(self.master_queue)
+        return self.agents_data.data(), np.array(self.master_queue)
 
     def visualize(self):
         # Convert data to a numpy array for easier handling
-        data = np.array(self.agents_data)
+        data = self.agents_data.data()
 
         data1 = np.array(self.master_queue)
     
@@ -1,6 +1,141 @@
-import math
+import os
+import sys
 import numpy as np
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from erlang import erlang_c, mmck_distribution
+
+
+def traffic_equations(external_arrivals, prob_matrix, method='iterative'):
+    """
+    Solves the traffic equations lambda = gamma + P^T lambda of an open network
+    as the linear system (I - P^T) lambda = gamma
+
+    Parameters:
+    external_arrivals: gamma, the external arrival rate of each station
+    prob_matrix: P, dense (list or array) or scipy.sparse routing matrix, P[i][j] the probability
+                 of going from station i to station j. Extra columns (an exit column) are ignored
+    method: for sparse P, 'iterative' (BiCGSTAB, falls back to the direct solve if it does not converge)
+            or 'direct' (sparse LU, which fills in on large irregular routing). Dense P is always factorized
+
+    Returns:
+    array of the total arrival rate of each station
+    """
+    gamma = np.asarray(external_arrivals, dtype=np.float64)
+    n = len(gamma)
+    if hasattr(prob_matrix, 'tocsc'):
+        # scipy.sparse routing, only needed (and imported) for sparse matrices
+        from scipy.sparse import identity
+        from scipy.sparse.linalg import bicgstab, spsolve
+        system = (identity(n, format='csr') - prob_matrix.tocsr()[:n, :n].T).tocsr()
+        if method == 'iterative':
+            arrival_rates, info = bicgstab(system, gamma, rtol=1e-12, atol=0.0)
+            if info == 0:
+                return arrival_rates
+        return np.asarray(spsolve(system.tocsc(), gamma))
+    routing = np.asarray(prob_matrix, dtype=np.float64)[:n, :n]
+    return np.linalg.solve(np.eye(n) - routing.T, gamma)
+
+
+def station_loads(arrival_rates, service_rates, num_servers):
+    """
+    Returns (rho, unstable): rho_i = lambda_i / (c_i mu_i) of every station and the indices
+    of the stations with rho_i >= 1, whose queues grow without bound
+    """
+    rho = np.asarray(arrival_rates, dtype=np.float64) / (np.asarray(num_servers) * np.asarray(service_rates, dtype=np.float64))
+    return rho, np.flatnonzero(rho >= 1)
+
+
+def screen_network(external_arrivals, service_rates, num_servers, prob_matrix):
+    """
+    Analytic screen of an open network: returns (arrival_rates, rho, unstable), see traffic_equations and station_loads
+    """
+    arrival_rates = traffic_equations(external_arrivals, prob_matrix)
+    rho, unstable = station_loads(arrival_rates, service_rates, num_servers)
+    return arrival_rates, rho, unstable
+
+
+def mm1_measures(arrival_rate, service_rate):
+    """
+    M/M/1 measures over arrays of parameters, broadcast against each other
+
+    Returns:
+    dict with the measures of the MMQueue classes, 'L', 'Lq', 'Ls', 'W', 'Wq', 'Ws',
+    and 'blocking', the probability an arrival is turned away, as arrays.
+    The queue measures are inf where rho >= 1
+    """
+    return mmc_measures(arrival_rate, service_rate, 1)
+
+
+def mmc_measures(arrival_rate, service_rate, c):
+    """
+    M/M/c measures over arrays of parameters, see mm1_measures
+    """
+    lambda_, mu, c = np.broadcast_arrays(np.asarray(arrival_rate, dtype=np.float64),
+                                         np.asarray(service_rate, dtype=np.float64), np.asarray(c, dtype=np.int64))
+    load = lambda_ / mu
+    rho = load / c
+    stable = rho < 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        Lq = np.where(stable, erlang_c(c, load) * rho / (1 - rho), np.inf)
+    L = Lq + load
+    return {'L': L, 'Lq': Lq, 'Ls': load, 'W': L / lambda_, 'Wq': Lq / lambda_, 'Ws': 1 / mu,
+            'blocking': np.zeros(load.shape)}
+
+
+def mm1k_measures(arrival_rate, service_rate, k):
+    """
+    M/M/1/k measures over arrays of parameters, see mmck_measures
+    """
+    return mmck_measures(arrival_rate, service_rate, 1, k)
+
+
+def mmck_measures(arrival_rate, service_rate, c, k):
+    """
+    M/M/c/k measures over arrays of parameters, see mm1_measures. 'blocking' is p_k.
+
+    p_n is built for every point at once, n = 0 .. max(k), from the log of the
+    ratios p_n / p_{n-1} = (lambda / mu) / min(n, c): a first pass finds the
+    largest log term of each point, a second sums the terms scaled by it, so
+    nothing overflows however many servers or places.
+    """
+    lambda_, mu, c, k = np.broadcast_arrays(np.asarray(arrival_rate, dtype=np.float64),
+                                            np.asarray(service_rate, dtype=np.float64),
+                                            np.asarray(c, dtype=np.int64), np.asarray(k, dtype=np.int64))
+    log_load = np.log(lambda_ / mu)
+    log_c = np.log(c)
+    max_k = int(k.max(initial=0))
+
+    def log_terms():
+        # log p_n + constant for n = 1 .. max(k), -inf past k
+        log_term = np.zeros(lambda_.shape)
+        for n in range(1, max_k + 1):
+            log_term += log_load - np.minimum(log_c, np.log(n))
+            log_term[k == n - 1] = -np.inf
+            yield n, log_term
+
+    log_max = np.zeros(lambda_.shape)
+    for n, log_term in log_terms():
+        np.maximum(log_max, log_term, out=log_max)
+
+    total = np.exp(-log_max)                  # sum of p_n, scaled by exp(-log_max)
+    in_system = np.zeros(lambda_.shape)       # sum of n p_n, same scale
+    last = np.where(k == 0, total, 0.0)       # p_k, same scale
+    for n, log_term in log_terms():
+        weight = np.exp(log_term - log_max)
+        total += weight
+        in_system += n * weight
+        at_k = k == n
+        last[at_k] = weight[at_k]
+
+    L = in_system / total
+    blocking = last / total
+    lambda_eff = lambda_ * (1 - blocking)
+    Ls = lambda_eff / mu
+    Lq = L - Ls
+    return {'L': L, 'Lq': Lq, 'Ls': Ls, 'W': L / lambda_eff, 'Wq': Lq / lambda_eff, 'Ws': 1 / mu,
+            'blocking': blocking}
+
 
 class MMQueue:
     def __init__(self, arrival_rate, service_rate):
@@ -41,7 +176,8 @@ class MM1kQueue(MMQueue):
             p0 = (1 - self.rho) / (1 - self.rho**(self.k + 1))
         
         self.L = self.rho * (1 - (self.k + 1) * self.rho**self.k + self.k * self.rho**(self.k + 1)) / ((1 - self.rho) * (1 - self.rho**(self.k + 1)))
-        self.Lq = self.L - self.rho * (1 - p0)
+        # the server is busy with probability 1 - p0
+        self.Lq = self.L - (1 - p0)
         self.Ls = self.L - self.Lq
         self.lambda_eff = self.lambda_ * (1 - self.rho**self.k * p0)
         self.W = self.L / self.lambda_eff
@@ -56,10 +192,7 @@ class MMcQueue(MMQueue):
 
     def calculate_measures(self):
         r = self.lambda_ / self.mu
-        p0 = 1 / (sum(r**n / math.factorial(n) for n in range(self.c)) + 
-                   (r**self.c / math.factorial(self.c)) * (1 / (1 - self.rho)))
-        
-        self.Lq = (r**self.c * self.rho * p0) / (math.factorial(self.c) * (1 - self.rho)**2)
+        self.Lq = erlang_c(self.c, r) * self.rho / (1 - self.rho)
         self.L = self.Lq + r
         self.Ls = r
         self.W = self.L / self.lambda_
@@ -74,42 +207,22 @@ class MMckQueue(MMQueue):
         self.rho = self.lambda_ / (self.c * self.mu)
 
     def calculate_measures(self):
-        if self.c == 1:
-            # If c = 1, use M/M/1/k calculations
-            mm1k = MM1kQueue(self.lambda_, self.mu, self.k)
-            mm1k.calculate_measures()
-            self.L = mm1k.L
-            self.Lq = mm1k.Lq
-            self.Ls = mm1k.Ls
-            self.W = mm1k.W
-            self.Wq = mm1k.Wq
-            self.Ws = mm1k.Ws
-            self.lambda_eff = mm1k.lambda_eff
-        else:
-            p0 = self._calculate_p0()
-            pn = self._calculate_pn(p0)
-            
-            self.L = sum(n * pn[n] for n in range(self.k + 1))
-            self.Lq = sum((n - self.c) * pn[n] for n in range(self.c + 1, self.k + 1))
-            self.Ls = self.L - self.Lq
-            self.lambda_eff = self.lambda_ * (1 - pn[self.k])
-            self.W = self.L / self.lambda_eff
-            self.Wq = self.Lq / self.lambda_eff
-            self.Ws = 1 / self.mu
+        pn = self._calculate_pn()
+        n = np.arange(self.k + 1)
+        self.L = n @ pn
+        self.Lq = np.maximum(n - self.c, 0) @ pn
+        self.Ls = self.L - self.Lq
+        self.lambda_eff = self.lambda_ * (1 - pn[self.k])
+        self.W = self.L / self.lambda_eff
+        self.Wq = self.Lq / self.lambda_eff
+        self.Ws = 1 / self.mu
 
     def _calculate_p0(self):
-        sum1 = sum((self.lambda_ / self.mu) ** n / math.factorial(n) for n in range(self.c))
-        sum2 = ((self.lambda_ / self.mu) ** self.c / math.factorial(self.c)) * sum((self.lambda_ / (self.c * self.mu)) ** n for n in range(self.k - self.c + 1))
-        return 1 / (sum1 + sum2)
-
-    def _calculate_pn(self, p0):
-        pn = {}
-        for n in range(self.k + 1):
-            if n <= self.c:
-                pn[n] = (self.lambda_ / self.mu) ** n * p0 / math.factorial(n)
-            else:
-                pn[n] = (self.lambda_ / self.mu) ** n * p0 / (self.c ** (n - self.c) * math.factorial(self.c))
-        return pn
+        return self._calculate_pn()[0]
+
+    def _calculate_pn(self):
+        # p_0 .. p_k computed in log space, exact for thousands of servers
+        return mmck_distribution(self.lambda_, self.mu, self.c, self.k)
 
 class series():
     def __init__(self, arrival_rate, service_rate, num_servers):
@@ -130,10 +243,7 @@ class series():
                 self.Ws = 1 / self.mu[stage]
             else:
                 r = self.lambda_ / self.mu[stage]
-                p0 = 1 / (sum(r**n / math.factorial(n) for n in range(self.c[stage])) + 
-                        (r**self.c[stage] / math.factorial(self.c[stage])) * (1 / (1 - self.rho[stage])))
-                
-                self.Lq = (r**self.c[stage] * self.rho[stage] * p0) / (math.factorial(self.c[stage]) * (1 - self.rho[stage])**2)
+                self.Lq = erlang_c(self.c[stage], r) * self.rho[stage] / (1 - self.rho[stage])
                 self.L = self.Lq + r
                 self.Ls = r
                 self.W = self.L / self.lambda_
@@ -160,43 +270,22 @@ class Jacksonnetwork():
         self.c = num_servers
         self.p_mat = prob_matrix
         if external_arrivals is None:
-            external_arrivals = [0] * len(service_rates)
+            external_arrivals = [0] * len(service_rate)
         self.external_arrivals = external_arrivals
         self.external_arrivals[0] = self.lambda_
         self.data = {stages:[] for stages in range(1, len(self.c))}
 
     def effective_arrival_rates(self):
-        effective_arrival = np.zeros(len(self.mu))
-
-        # Initialize the external arrival rates for each node
-        for i in range(len(self.mu)):
-            effective_arrival[i] = self.external_arrivals[i]
-
-        # Iteratively solve for the effective arrival rates
-        convergence_threshold = 1e-6
-        max_iterations = 1000
-        for _ in range(max_iterations):
-            previous_arrival = effective_arrival.copy()
-            for i in range(len(self.mu)):
-                if i == 0:
-                    # Formula = lambda_i = r_i + sum(prob_mat(i,j)*lambda_j)
-                    effective_arrival[i] = self.lambda_ + sum(previous_arrival[j] * self.p_mat[j][i] for j in range(len(self.mu)))
-                else:
-                    effective_arrival[i] = self.external_arrivals[i] + sum(previous_arrival[j] * self.p_mat[j][i] for j in range(len(self.mu)))
-            # Check for convergence
-            if np.all(np.abs(effective_arrival - previous_arrival) < convergence_threshold):
-                break
+        # lambda_i = r_i + sum(prob_mat(j,i)*lambda_j), solved directly
+        external = np.array(self.external_arrivals, dtype=np.float64)
+        external[0] = self.lambda_
+        effective_arrival = traffic_equations(external, self.p_mat)
 
         print(effective_arrival)
         return effective_arrival
     
     def utilization_factor(self, effective_arrival):
-        rho = np.zeros(len(self.mu))
-        for i in range(len(self.mu)):
-            if self.c[i] == 1:
-                rho[i] = effective_arrival[i]/self.mu[i]
-            else:
-                rho[i] = effective_arrival[i]/self.c[i] * self.mu[i]
+        rho, self.unstable = station_loads(effective_arrival, self.mu, self.c)
         return rho
     
     def calculate_measures(self):
@@ -212,9 +301,7 @@ class Jacksonnetwork():
                 self.Ws = 1 / self.mu[stage]
             else:
                 r = self.effective_arrival[stage]/ self.mu[stage]
-                p0 = 1 / (sum(r**n / math.factorial(n) for n in range(self.c[stage])) + 
-                        (r**self.c[stage] / math.factorial(self.c[stage])) * (1 / (1 - self.rho[stage])))
-                self.Lq = (r**self.c[stage] * self.rho[stage] * p0) / (math.factorial(self.c[stage]) * (1 - self.rho[stage])**2)
+                self.Lq = erlang_c(self.c[stage], r) * self.rho[stage] / (1 - self.rho[stage])
                 self.L = self.Lq + r
                 self.Ls = r
                 self.W = self.L / self.effective_arrival[stage]
@@ -236,69 +323,59 @@ class Jacksonnetworkfinitecapacity():
         self.data = {stages:[] for stages in range(1, len(self.c))}
 
     def effective_arrival_rates(self):
-        effective_arrival = np.zeros(len(self.mu))
-        effective_arrival[0] = self.lambda_
-
-        for i in range(1, len(self.mu)):
-            for j in range(len(self.mu)):
-                effective_arrival[i] += effective_arrival[j] * self.p_mat[j][i]        
-        return effective_arrival
+        external = np.zeros(len(self.mu))
+        external[0] = self.lambda_
+        return traffic_equations(external, self.p_mat)
     
     def utilization_factor(self, effective_arrival):
-        rho = np.zeros(len(self.mu))
-        for i in range(len(self.mu)):
-            if self.c[i] == 1:
-                rho[i] = effective_arrival[i]/self.mu[i]
-            else:
-                rho[i] = effective_arrival[i]/ (self.c[i] * self.mu[i])
+        rho, self.unstable = station_loads(effective_arrival, self.mu, self.c)
         return rho
     
     def calculate_measures(self):
         self.effective_arrival = self.effective_arrival_rates()
         self.rho = self.utilization_factor(self.effective_arrival)
         for stage in range(len(self.mu)):
-            if self.c[stage] == 1:
-                if self.rho[stage] == 1:
-                    p0 = 1 / (self.k[stage] + 1)
-                else:
-                    p0 = (1 - self.rho[stage]) / (1 - self.rho[stage]**(self.k[stage] + 1))
-                
-                self.L = self.rho[stage] * (1 - (self.k[stage] + 1) * self.rho[stage]**self.k[stage] + self.k[stage] * self.rho[stage]**(self.k[stage] + 1)) / ((1 - self.rho[stage]) * (1 - self.rho[stage]**(self.k[stage] + 1)))
-                self.Lq = self.L - self.rho[stage] * (1 - p0)
-                self.Ls = self.L - self.Lq
-                self.lambda_eff = self.effective_arrival[stage] * (1 - self.rho[stage]**self.k[stage] * p0)
-                self.W = self.L / self.lambda_eff
-                self.Wq = self.Lq / self.lambda_eff
-                self.Ws = 1 / self.mu[stage]
-            else:
-                p0 = self._calculate_p0(stage)
-                pn = self._calculate_pn(p0, stage)
-                
-                self.L = sum(n * pn[n] for n in range(self.k[stage] + 1))
-                self.Lq = sum((n - self.c[stage]) * pn[n] for n in range(self.c[stage] + 1, self.k[stage] + 1))
-                self.Ls = self.L - self.Lq
-                self.lambda_eff = self.effective_arrival[stage] * (1 - pn[self.k[stage]])
-                self.W = self.L / self.lambda_eff
-                self.Wq = self.Lq / self.lambda_eff
-                self.Ws = 1 / self.mu[stage]
-            
+            pn = self._calculate_pn(stage)
+            p0 = pn[0]
+            n = np.arange(self.k[stage] + 1)
+            self.L = n @ pn
+            self.Lq = np.maximum(n - self.c[stage], 0) @ pn
+            self.Ls = self.L - self.Lq
+            self.lambda_eff = self.effective_arrival[stage] * (1 - pn[self.k[stage]])
+            self.W = self.L / self.lambda_eff
+            self.Wq = self.Lq / self.lambda_eff
+            self.Ws = 1 / self.mu[stage]
+        
             self.data[stage + 1] = [self.L, self.Lq, self.Ls, self.W, self.Wq, self.Ws, p0]
             
         return self.data , self.effective_arrival, self.rho
 
     def _calculate_p0(self, stage):
-        sum1 = sum((self.effective_arrival[stage]/ self.mu[stage]) ** n / math.factorial(n) for n in range(self.c[stage]))
-        sum2 = ((self.effective_arrival[stage]/ self.mu[stage]) ** self.c[stage] / math.factorial(self.c[stage])) * sum((self.effective_arrival[stage] / (self.c[stage] * self.mu[stage])) ** n for n in range(self.k[stage]- self.c[stage] + 1))
-        return 1 / (sum1 + sum2)
-
-    def _calculate_pn(self, p0, stage):
-        pn = {}
-        for n in range(self.k[stage] + 1):
-            if n <= self.c[stage]:
-                pn[n] = (self.effective_arrival[stage] / self.mu[stage]) ** n * p0 / math.factorial(n)
-            else:
-                pn[n] = (self.effective_arrival[stage] / self.mu[stage]) ** n * p0 / (self.c[stage] ** (n - self.c[stage]) * math.factorial(self.c[stage]))
-        return pn
+        return self._calculate_pn(stage)[0]
+
+    def _calculate_pn(self, stage):
+        return mmck_distribution(self.effective_arrival[stage], self.mu[stage], self.c[stage], self.k[stage])
+
+def mmc_controls(arrival_rates, service_rates, num_servers, indexed=True):
+    """
+    Exact M/M/c values of each station, named as the summaries of replications.py
+    (L[i], L_q[i], L_s[i], W[i], W_q[i], W_s[i]), for ReplicationResults.control_variate_intervals.
+    arrival_rates are the total arrival rates of the stations. W_s[i] = 1 / mu holds at any station,
+    the others at the stations that really are M/M/c (e.g. the first stage of a series system)
+
+    indexed: False for the single station of MMmQueue (Series_system/M_M_s.py), whose
+             station_statistics have no [i] in their names (L, L_q, ...)
+    """
+    if not indexed and len(arrival_rates) != 1:
+        raise ValueError(f"Names without an index need exactly one station, got {len(arrival_rates)}")
+    controls = {}
+    for i, (arrival_rate, service_rate, c) in enumerate(zip(arrival_rates, service_rates, num_servers)):
+        queue = MMcQueue(arrival_rate, service_rate, c)
+        queue.calculate_measures()
+        suffix = f"[{i}]" if indexed else ""
+        controls.update({f"L{suffix}": queue.L, f"L_q{suffix}": queue.Lq, f"L_s{suffix}": queue.Ls,
+                         f"W{suffix}": queue.W, f"W_q{suffix}": queue.Wq, f"W_s{suffix}": queue.Ws})
+    return controls
 
 def analyze_queue(queue_type, *args):
     queue = queue_type(*args)
@@ -0,0 +1,70 @@
+class PooledAgent:
+    """
+    Agent with __slots__ instead of a per-instance __dict__.
+    It carries the same attributes as the Agent classes of the simulators.
+
+    Parameters:
+    arrival_time: arrival time of the agent
+    agent_id: the unique id of the agent
+
+    Attributes:
+    arrival_time: Time when the agent arrives in the system
+    service_start_time: Time when the agent starts it service
+    departure_time: Time when the agent departs
+    queue_length_on_arrival: Queue length when the agent arrives in the system
+    server_id: The server number which provides service to the agent
+    agent_id: The unique number of the agent
+    current_queue: The queue the agent is currently in
+    queue_path: list of the queues the agent visited. The list is reused when the agent is recycled
+    """
+    __slots__ = ('arrival_time', 'service_start_time', 'departure_time', 'queue_length_on_arrival',
+                 'server_id', 'agent_id', 'current_queue', 'queue_path')
+
+    def __init__(self, arrival_time, agent_id):
+        self.queue_path = []
+        self.reset(arrival_time, agent_id)
+
+    def reset(self, arrival_time, agent_id):
+        self.arrival_time = arrival_time
+        self.service_start_time = None
+        self.departure_time = None
+        self.queue_length_on_arrival = None
+        self.server_id = None
+        self.agent_id = agent_id
+        self.current_queue = 0
+        self.queue_path.clear()
+
+    def __lt__(self, other):
+        return self.arrival_time < other.arrival_time
+
+
+class AgentPool:
+    """
+    Recycles agents once they leave the network.
+
+    acquire() hands out a released agent, reset to the new arrival time and id,
+    and only creates a new PooledAgent when the pool is empty. The number of
+    agent objects ever created is therefore the peak number of agents in the
+    network, not the number of customers.
+
+    An agent must not be released while an event record or a waiting line
+    still refers to it.
+    """
+    def __init__(self):
+        self.free_agents = []
+        self.created = 0
+
+    def acquire(self, arrival_time, agent_id):
+        if self.free_agents:
+            agent = self.free_agents.pop()
+            agent.reset(arrival_time, agent_id)
+            return agent
+        self.created += 1
+        return PooledAgent(arrival_time, agent_id)
+
+    def release(self, agent):
+        self.free_agents.append(agent)
+
+    def __len__(self):
+        # number of agents waiting to be reused
+        return len(self.free_agents)
@@ -0,0 +1,212 @@
+"""
+Lockstep simulation of many replications of a Markovian network at once.
+
+When only time averages are wanted, a Jackson network is a continuous-time
+Markov chain on the number of agents at each station, and no agent objects or
+event list are needed. BatchedNetwork keeps that state for R replications in
+(R, stations) arrays and advances all of them one transition per step: every
+replication draws its holding time from the sum of the rates of its competing
+exponential clocks (the external arrivals and the busy servers), picks the
+clock that fired in proportion to its rate and, for a service completion,
+routes the agent with one more uniform. The Python interpreter runs once per
+transition of the longest replication instead of once per event of every
+replication.
+
+    network = BatchedNetwork(1.0, [1.5, 1.5, 2, 2], 1000, [1, 1, 1, 1], prob_matrix, replications=2000, seed=2)
+    report = network.simulate()          # report['L'] is an array (2000, 4)
+    network.results().confidence_intervals()
+
+The report has the keys of station_stats.StationStatistics.report(), each an
+array with one row per replication.
+"""
+import numpy as np
+
+from replications import ReplicationResults
+from variates import ARRIVALS, ROUTING, SERVICE, RandomStreams
+
+
+class BatchedNetwork:
+    """
+    Parameters:
+    arrival_rate: external arrival rate, a number for arrivals at queue 0 only
+                  (as OpenQueueNetwork) or a list with the rate of each queue
+    service_rates: list of the service rate of each server of each queue
+    max_time: The max simulation time
+    num_servers: list of the number of servers of each queue
+    prob_matrix: routing matrix, row i holds the probabilities of going from queue i to each queue,
+                 the rest of the row is the probability of leaving the network
+    replications: number of replications R advanced together
+    capacities: list of the waiting room of each queue, an agent that finds every server busy
+                and the waiting room full is rejected (as Jackson_net_finite_cap.py). Default: infinite
+    seed: int or numpy SeedSequence of the random streams, see variates.RandomStreams
+    block_size: number of steps the uniforms are drawn for at once
+
+    Attributes:
+    in_system: array (R, queues)- agents at each queue, waiting or in service
+    clock: array (R,)- time of each replication, max_time once it is done
+    """
+    def __init__(self, arrival_rate, service_rates, max_time, num_servers, prob_matrix, replications,
+                 capacities=None, seed=None, block_size=256):
+        self.num_queues = len(num_servers)
+        if np.ndim(arrival_rate) == 0:
+            self.arrival_rates = np.zeros(self.num_queues)
+            self.arrival_rates[0] = arrival_rate
+        else:
+            self.arrival_rates = np.asarray(arrival_rate, dtype=np.float64)
+        self.service_rates = np.asarray(service_rates, dtype=np.float64)
+        self.max_time = max_time
+        self.num_servers = np.asarray(num_servers, dtype=np.int64)
+        self.prob_matrix = np.asarray(prob_matrix, dtype=np.float64)
+        self.replications = replications
+        if capacities is None:
+            self.limits = None
+        else:
+            self.limits = self.num_servers + np.asarray(capacities, dtype=np.float64)
+        self.block_size = block_size
+
+        # one generator per purpose: holding times, which clock fired, routing
+        streams = RandomStreams(seed)
+        self.clock_rng = streams.generator(ARRIVALS)
+        self.event_rng = streams.generator(SERVICE)
+        self.routing_rng = streams.generator(ROUTING)
+        self.cumulative_routing = np.cumsum(self.prob_matrix, axis=1)
+        # rates of the competing clocks: external arrivals (fixed), then service completions
+        self.rates = np.zeros((replications, 2 * self.num_queues))
+        self.rates[:, :self.num_queues] = self.arrival_rates
+
+        shape = (replications, self.num_queues)
+        self.in_system = np.zeros(shape, dtype=np.int64)
+        self.clock = np.zeros(replications)
+        self.area_in_system = np.zeros(shape)
+        self.area_busy = np.zeros(shape)
+        self.arrivals = np.zeros(shape, dtype=np.int64)
+        self.departures = np.zeros(shape, dtype=np.int64)
+        self.blocked = np.zeros(shape, dtype=np.int64)
+        self.steps = 0
+
+    def admit(self, rows, queue_ids):
+        """
+        Agents arrive at queue_ids in the replications rows (one agent per replication)
+        """
+        self.arrivals[rows, queue_ids] += 1
+        if self.limits is not None:
+            full = self.in_system[rows, queue_ids] >= self.limits[queue_ids]
+            self.blocked[rows[full], queue_ids[full]] += 1
+            rows = rows[~full]
+            queue_ids = queue_ids[~full]
+        self.in_system[rows, queue_ids] += 1
+
+    def step(self, holding, choice, routing):
+        """
+        Advances every replication by one transition, or to max_time if the next one comes later.
+        holding, choice, routing: Uniform(0, 1) arrays (R,)
+        Returns the number of replications still running
+        """
+        num_queues = self.num_queues
+        busy = np.minimum(self.in_system, self.num_servers)
+        rates = self.rates
+        np.multiply(busy, self.service_rates, out=rates[:, num_queues:])
+        total = rates.sum(axis=1)
+        with np.errstate(divide='ignore'):
+            elapsed = -np.log1p(-holding) / total
+        remaining = self.max_time - self.clock
+        running = elapsed <= remaining
+        elapsed = np.where(running, elapsed, remaining)
+        self.area_in_system += self.in_system * elapsed[:, None]
+        self.area_busy += busy * elapsed[:, None]
+        self.clock += elapsed
+
+        rows = np.flatnonzero(running)
+        if len(rows) == 0:
+            return 0
+        # the clock that fired: arrivals at queue i are event i, completions at queue i are event num_queues + i
+        thresholds = (choice[rows] * total[rows])[:, None]
+        events = np.minimum(np.count_nonzero(np.cumsum(rates[rows], axis=1) < thresholds, axis=1), 2 * num_queues - 1)
+
+        external = events < num_queues
+        arrival_rows = rows[external]
+        arrival_queues = events[external]
+
+        done = ~external
+        departure_rows = rows[done]
+        departure_queues = events[done] - num_queues
+        self.in_system[departure_rows, departure_queues] -= 1
+        self.departures[departure_rows, departure_queues] += 1
+        targets = np.count_nonzero(self.cumulative_routing[departure_queues] < routing[departure_rows, None], axis=1)
+        routed = targets < num_queues
+
+        self.admit(np.concatenate((arrival_rows, departure_rows[routed])),
+                   np.concatenate((arrival_queues, targets[routed])))
+        self.steps += 1
+        return len(rows)
+
+    def simulate(self):
+        """
+        Runs every replication to max_time and returns report()
+        """
+        running = self.replications
+        while running:
+            uniforms = (self.clock_rng.random((self.block_size, self.replications)),
+                        self.event_rng.random((self.block_size, self.replications)),
+                        self.routing_rng.random((self.block_size, self.replications)))
+            for holding, choice, routing in zip(*uniforms):
+                running = self.step(holding, choice, routing)
+                if not running:
+                    break
+        return self.report()
+
+    def report(self):
+        """
+        Time-average statistics of every replication from 0 to its clock, as StationStatistics.report()
+        with each value an array (R, queues)
+        """
+        total_time = self.clock[:, None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            L = np.where(total_time > 0, self.area_in_system / total_time, 0.0)
+            L_s = np.where(total_time > 0, self.area_busy / total_time, 0.0)
+            throughput = np.where(total_time > 0, self.departures / total_time, 0.0)
+            L_q = L - L_s
+            return {
+                'L': L,
+                'L_q': L_q,
+                'L_s': L_s,
+                'W': np.where(throughput > 0, L / throughput, 0.0),
+                'W_q': np.where(throughput > 0, L_q / throughput, 0.0),
+                'W_s': np.where(throughput > 0, L_s / throughput, 0.0),
+                'Utilization': L_s / self.num_servers,
+                'Throughput': throughput,
+                'Blocked customers': self.blocked.copy(),
+                'Total arrivals': self.arrivals.copy(),
+                'Total departures': self.departures.copy()
+            }
+
+    def results(self):
+        """
+        Returns the report as replications.ReplicationResults, named as replications.station_statistics names them
+        """
+        report = self.report()
+        names = tuple(f"{key}[{i}]" for i in range(self.num_queues) for key in report)
+        samples = np.column_stack([report[key][:, i] for i in range(self.num_queues) for key in report]).astype(np.float64)
+        return ReplicationResults(names, samples)
+
+
+class BatchedStation(BatchedNetwork):
+    """
+    R replications of the M/M/c station of MMmQueue (Series_system/M_M_s.py), same parameters.
+    The agent that finds every server busy joins the line while it holds no more than
+    max_queue_length + num_servers agents, as in MMmQueue.handle_arrival
+
+    report() and results() give the statistics of the single station: arrays (R,)
+    and the names of MMmQueue.get_statistics()
+    """
+    def __init__(self, arrival_rate, service_rate, max_time, num_servers, max_queue_length, replications,
+                 seed=None, block_size=256):
+        super().__init__(arrival_rate, [service_rate], max_time, [num_servers], [[0.0]], replications,
+                         capacities=[max_queue_length + num_servers + 1], seed=seed, block_size=block_size)
+
+    def report(self):
+        return {key: value[:, 0] for key, value in super().report().items()}
+
+    def results(self):
+        report = self.report()
+        return ReplicationResults(tuple(report), np.column_stack(list(report.values())).astype(np.float64))
@@ -0,0 +1,78 @@
+import time
+import tracemalloc
+from collections import deque
+
+from agent_pool import AgentPool, PooledAgent
+
+
+class Agent:
+    # The dict-based agent every simulator used to create, kept here as the baseline
+    def __init__(self, arrival_time, agent_id):
+        self.arrival_time = arrival_time
+        self.service_start_time = None
+        self.departure_time = None
+        self.queue_length_on_arrival = None
+        self.server_id = None
+        self.agent_id = agent_id
+        self.current_queue = 0
+        self.queue_path = []
+
+    def __lt__(self, other):
+        return self.arrival_time < other.arrival_time
+
+
+def measure(run):
+    """
+    Runs run() and returns its wall time and the peak of traced Python memory in bytes
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    keep = run()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del keep
+    return elapsed, peak
+
+
+def live_population(make_agent, num_agents):
+    """
+    num_agents agents alive at the same time, e.g. a long waiting line
+    """
+    def run():
+        return [make_agent(float(i), i) for i in range(num_agents)]
+    return run
+
+
+def churn(acquire, release, num_agents, num_in_system):
+    """
+    num_agents customers pass through a network that holds num_in_system of them at a time
+    """
+    def run():
+        in_system = deque()
+        for i in range(num_agents):
+            in_system.append(acquire(float(i), i))
+            if len(in_system) > num_in_system:
+                release(in_system.popleft())
+        return in_system
+    return run
+
+
+if __name__ == "__main__":
+    num_agents = 1_000_000
+    num_in_system = 1_000
+
+    pool = AgentPool()
+    cases = [
+        ("live, dict Agent", live_population(Agent, num_agents)),
+        ("live, slotted PooledAgent", live_population(PooledAgent, num_agents)),
+        ("churn, dict Agent", churn(Agent, lambda agent: None, num_agents, num_in_system)),
+        ("churn, pooled PooledAgent", churn(pool.acquire, pool.release, num_agents, num_in_system)),
+    ]
+
+    print(f"{num_agents} agents, {num_in_system} in the system at a time for the churn cases")
+    print(f"{'case':<28}{'time [s]':>10}{'peak [MB]':>12}")
+    for name, run in cases:
+        elapsed, peak = measure(run)
+        print(f"{name:<28}{elapsed:>10.3f}{peak / 2**20:>12.2f}")
+    print(f"agents created by the pool: {pool.created}")
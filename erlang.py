@@ -0,0 +1,59 @@
+"""
+Numerically stable Erlang-B/C and M/M/c/K state probabilities.
+
+The textbook formulas build r**n / n! term by term: math.factorial overflows a
+float beyond n = 170 and r**n overflows for large loads long before the ratio
+would. Here nothing larger than the answer is ever formed:
+
+- Erlang-B by the recurrence B(0) = 1, B(k) = a B(k-1) / (k + a B(k-1)),
+  which stays in [0, 1] for any number of servers,
+- Erlang-C from it, C = B / (1 - rho (1 - B)),
+- the M/M/c/K probabilities p_n from the log of the ratios
+  p_n / p_{n-1} = a / min(n, c), normalised in log space.
+
+The functions take NumPy arrays and broadcast them.
+"""
+import numpy as np
+
+
+def erlang_b(servers, load):
+    """
+    Returns the blocking probability B(c, a) of an M/M/c/c queue
+
+    servers: number of servers c, int or int array
+    load: offered load a = lambda / mu, broadcast against servers
+    """
+    servers, load = np.broadcast_arrays(np.asarray(servers, dtype=np.int64), np.asarray(load, dtype=np.float64))
+    blocking = np.ones(load.shape)
+    result = np.ones(load.shape)
+    for k in range(1, int(servers.max(initial=0)) + 1):
+        blocking = load * blocking / (k + load * blocking)
+        at_k = servers == k
+        result[at_k] = blocking[at_k]
+    return result[()]
+
+
+def erlang_c(servers, load):
+    """
+    Returns the probability C(c, a) that an arrival waits in an M/M/c queue, 1 where rho = a / c >= 1
+    """
+    servers = np.asarray(servers, dtype=np.int64)
+    load = np.asarray(load, dtype=np.float64)
+    rho = load / servers
+    blocking = erlang_b(servers, load)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        waiting = blocking / (1 - rho * (1 - blocking))
+    return np.where(rho < 1, waiting, 1.0)[()]
+
+
+def mmck_distribution(arrival_rate, service_rate, servers, capacity):
+    """
+    Returns the array p_0 .. p_K of the number in system of an M/M/c/K queue
+
+    capacity: K, the most agents the station holds, waiting or in service
+    """
+    n = np.arange(1, capacity + 1)
+    log_terms = np.concatenate(([0.0], np.cumsum(np.log(arrival_rate / service_rate) - np.log(np.minimum(n, servers)))))
+    log_terms -= log_terms.max()
+    probabilities = np.exp(log_terms)
+    return probabilities / probabilities.sum()
@@ -0,0 +1,321 @@
+"""
+Pending-event sets for the simulators.
+
+Every backend stores the event records described in events.py,
+(time, event_code, seq, agent, queue_id), and exposes the same interface:
+
+push(time, event_code, agent, queue_id): schedule an event
+pop(): remove and return the earliest record
+len(event_list): number of pending events
+
+The seq tie-breaker is generated by the event list itself, so records popped
+from any backend come out in exactly the same order.
+
+Backends:
+heap: binary heap (heapq). O(log n) insert and remove
+calendar: calendar queue (Brown, 1988). O(1) amortised insert and remove
+ladder: ladder queue (Tang, Goh and Thng, 2005). O(1) amortised insert and remove
+
+Use make_event_list(kind) to build one by name.
+"""
+import heapq
+from bisect import insort
+from math import inf
+
+from events import event_sequence
+
+
+class BinaryHeap:
+    """
+    The binary heap every simulator used to manage by hand with heapq.
+    """
+    def __init__(self):
+        self.heap = []
+        self.event_seq = event_sequence()
+
+    def push(self, time, event_code, agent, queue_id=0):
+        heapq.heappush(self.heap, (time, event_code, next(self.event_seq), agent, queue_id))
+
+    def pop(self):
+        return heapq.heappop(self.heap)
+
+    def __len__(self):
+        return len(self.heap)
+
+
+class CalendarQueue:
+    """
+    Calendar queue.
+
+    Events are hashed by time into num_buckets "days" of length bucket_width.
+    Each day holds a short sorted list. pop() walks the calendar from the
+    current day; the calendar is rebuilt with a new day length whenever the
+    number of events grows past twice or falls under half the number of days.
+
+    Parameters:
+    num_buckets: initial number of days
+    bucket_width: initial day length
+    """
+    def __init__(self, num_buckets=2, bucket_width=1.0):
+        self.event_seq = event_sequence()
+        self.size = 0
+        self._build(num_buckets, bucket_width, [])
+
+    def _build(self, num_buckets, bucket_width, records):
+        self.num_buckets = num_buckets
+        self.bucket_width = bucket_width
+        self.buckets = [[] for _ in range(num_buckets)]
+        self.current_day = 0  # virtual (never wrapped) index of the day being served
+        for record in records:
+            day = int(record[0] / bucket_width)
+            insort(self.buckets[day % num_buckets], record)
+        if records:
+            self.current_day = int(min(records)[0] / bucket_width)
+        self.grow_at = 2 * num_buckets
+        self.shrink_at = num_buckets // 2 - 2
+
+    def _resize(self, num_buckets):
+        records = [record for bucket in self.buckets for record in bucket]
+        self._build(num_buckets, self._estimate_width(records), records)
+
+    def _estimate_width(self, records):
+        # Brown's rule: three times the average separation of the earliest events
+        sample = heapq.nsmallest(min(len(records), 25), records)
+        gaps = [later[0] - earlier[0] for earlier, later in zip(sample, sample[1:])]
+        gaps = [gap for gap in gaps if gap > 0]
+        if not gaps:
+            return self.bucket_width
+        mean_gap = sum(gaps) / len(gaps)
+        # drop the outliers before averaging again
+        close_gaps = [gap for gap in gaps if gap <= 2 * mean_gap] or gaps
+        return 3 * sum(close_gaps) / len(close_gaps)
+
+    def push(self, time, event_code, agent, queue_id=0):
+        record = (time, event_code, next(self.event_seq), agent, queue_id)
+        day = int(time / self.bucket_width)
+        insort(self.buckets[day % self.num_buckets], record)
+        if day < self.current_day:
+            self.current_day = day
+        self.size += 1
+        if self.size > self.grow_at:
+            self._resize(2 * self.num_buckets)
+
+    def pop(self):
+        if not self.size:
+            raise IndexError("pop from an empty event list")
+        buckets = self.buckets
+        num_buckets = self.num_buckets
+        width = self.bucket_width
+        day = self.current_day
+        for day in range(day, day + num_buckets):
+            bucket = buckets[day % num_buckets]
+            # same hashing as push(), so rounding cannot move an event to another day
+            if bucket and int(bucket[0][0] / width) <= day:
+                break
+        else:
+            # nothing due within a full year, jump straight to the earliest event
+            day = int(min(bucket[0] for bucket in buckets if bucket)[0] / width)
+            bucket = buckets[day % num_buckets]
+        record = bucket.pop(0)
+        self.current_day = day
+        self.size -= 1
+        if self.size < self.shrink_at:
+            self._resize(max(2, self.num_buckets // 2))
+        return record
+
+    def __len__(self):
+        return self.size
+
+
+class _Rung:
+    """
+    One rung of a ladder queue: num_buckets unsorted buckets of equal width,
+    starting at start. current is the first bucket that has not been handed
+    down to the next rung or to the bottom yet.
+    """
+    def __init__(self, start, bucket_width, num_buckets):
+        self.start = start
+        self.bucket_width = bucket_width
+        self.buckets = [[] for _ in range(num_buckets)]
+        self.current = 0
+        self.size = 0
+
+    def current_start(self):
+        return self.start + self.current * self.bucket_width
+
+    def add(self, record):
+        time = record[0]
+        index = int((time - self.start) / self.bucket_width)
+        # guard against rounding at the bucket edges: bucket i holds the times in
+        # [start + i * bucket_width, start + (i + 1) * bucket_width), computed exactly
+        # as current_start() is, so an event at an edge time never lands on both sides of it
+        index = min(max(index, self.current), len(self.buckets) - 1)
+        while index > self.current and time < self.start + index * self.bucket_width:
+            index -= 1
+        while index < len(self.buckets) - 1 and time >= self.start + (index + 1) * self.bucket_width:
+            index += 1
+        self.buckets[index].append(record)
+        self.size += 1
+
+
+class LadderQueue:
+    """
+    Ladder queue.
+
+    top: unsorted list of far-future events (time > top_start)
+    rungs: buckets of decreasing width that split the near future
+    bottom: short sorted list the next events are popped from
+
+    Events are only sorted once they reach the bottom, in groups of at most
+    bucket_threshold, which gives O(1) amortised insert and remove.
+
+    Parameters:
+    bucket_threshold: largest bucket that is sorted directly into the bottom
+    max_rungs: largest number of rungs
+    """
+    def __init__(self, bucket_threshold=50, max_rungs=8):
+        self.event_seq = event_sequence()
+        self.bucket_threshold = bucket_threshold
+        self.max_rungs = max_rungs
+        self.top = []
+        self.top_start = -inf
+        self.top_min = inf
+        self.top_max = -inf
+        self.rungs = []
+        self.bottom = []  # sorted in decreasing order, the next event is bottom[-1]
+        self.size = 0
+
+    def push(self, time, event_code, agent, queue_id=0):
+        record = (time, event_code, next(self.event_seq), agent, queue_id)
+        self.size += 1
+        if time > self.top_start:
+            self.top.append(record)
+            if time < self.top_min:
+                self.top_min = time
+            if time > self.top_max:
+                self.top_max = time
+            return
+        for rung in self.rungs:
+            if time >= rung.current_start():
+                rung.add(record)
+                return
+        # reversed insort: negate the ordering by searching on the reversed list
+        bottom = self.bottom
+        low, high = 0, len(bottom)
+        while low < high:
+            middle = (low + high) // 2
+            if bottom[middle] > record:
+                low = middle + 1
+            else:
+                high = middle
+        bottom.insert(low, record)
+
+    def pop(self):
+        if not self.size:
+            raise IndexError("pop from an empty event list")
+        if not self.bottom:
+            self._refill_bottom()
+        self.size -= 1
+        return self.bottom.pop()
+
+    def _refill_bottom(self):
+        while True:
+            if not self.rungs:
+                if not self._top_to_rung() or self.bottom:
+                    return
+            rung = self.rungs[-1]
+            buckets = rung.buckets
+            while rung.current < len(buckets) and not buckets[rung.current]:
+                rung.current += 1
+            if rung.current == len(buckets):
+                self.rungs.pop()
+                continue
+            bucket = buckets[rung.current]
+            buckets[rung.current] = []
+            rung.current += 1
+            rung.size -= len(bucket)
+            if len(bucket) > self.bucket_threshold and len(self.rungs) < self.max_rungs:
+                times = [record[0] for record in bucket]
+                low, high = min(times), max(times)
+                if high > low:
+                    start = rung.start + (rung.current - 1) * rung.bucket_width
+                    child = _Rung(start, rung.bucket_width / len(bucket), len(bucket) + 1)
+                    for record in bucket:
+                        child.add(record)
+                    self.rungs.append(child)
+                    continue
+            bucket.sort(reverse=True)
+            self.bottom = bucket
+            return
+
+    def _top_to_rung(self):
+        top = self.top
+        if not top:
+            return False
+        low, high = self.top_min, self.top_max
+        self.top = []
+        self.top_start = high
+        self.top_min = inf
+        self.top_max = -inf
+        if high == low or len(top) <= self.bucket_threshold:
+            top.sort(reverse=True)
+            self.bottom = top
+            return True
+        rung = _Rung(low, (high - low) / len(top), len(top) + 1)
+        for record in top:
+            rung.add(record)
+        self.rungs.append(rung)
+        return True
+
+    def __len__(self):
+        return self.size
+
+
+EVENT_LISTS = {
+    'heap': BinaryHeap,
+    'calendar': CalendarQueue,
+    'ladder': LadderQueue,
+}
+
+
+def make_event_list(kind='heap'):
+    """
+    Returns an empty event list of the given backend.
+
+    Parameters:
+    kind: 'heap', 'calendar' or 'ladder'
+    """
+    try:
+        return EVENT_LISTS[kind]()
+    except KeyError:
+        raise ValueError(f"Unknown event list: {kind}. Choose one of {sorted(EVENT_LISTS)}") from None
+
+
+if __name__ == "__main__":
+    # Regression check: every backend pops the same records in the same order as the heap,
+    # on a hold workload where many events share a timestamp (integer times, both event codes)
+    import random
+
+    for run in range(400):
+        rng = random.Random(run)
+        operations = [('pop',) if i >= 20 and rng.random() < 0.4 else
+                      ('push', float(rng.randint(0, 5)) if rng.random() < 0.5 else rng.random(), rng.randint(0, 1))
+                      for i in range(300)]
+        popped = {}
+        for kind in EVENT_LISTS:
+            event_list = make_event_list(kind)
+            now = 0.0
+            order = []
+            for operation in operations:
+                if operation[0] == 'push':
+                    event_list.push(now + operation[1], operation[2], None)
+                elif event_list:
+                    record = event_list.pop()
+                    now = record[0]
+                    order.append(record[:3])
+            while event_list:
+                order.append(event_list.pop()[:3])
+            popped[kind] = order
+        for kind, order in popped.items():
+            assert order == popped['heap'], f"{kind} pops out of order in run {run}"
+    print("All event lists pop equal-time records in the same order")
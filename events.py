@@ -0,0 +1,28 @@
+"""
+Event records shared by the simulators.
+
+An event is a plain tuple (time, event_code, seq, agent, queue_id).
+
+time: simulation time of the event
+event_code: small integer code, ARRIVAL or DEPARTURE.
+            ARRIVAL < DEPARTURE so arrivals are still handled first on time ties
+seq: monotonically increasing counter, unique per simulator.
+     Two records never compare equal up to seq, so heapq never falls back
+     to comparing the agents
+agent: the Agent object of the event
+queue_id: the stage/queue the event belongs to
+"""
+from itertools import count
+
+ARRIVAL = 0
+DEPARTURE = 1
+
+EVENT_NAMES = ('arrival', 'departure')
+
+
+def event_sequence():
+    """
+    Returns a fresh tie-breaking counter for a simulator.
+    Use it as next(self.event_seq) when building an event record.
+    """
+    return count()
@@ -1,9 +1,15 @@
 import numpy as np
-import heapq
+from collections import deque
 import matplotlib.pyplot as plt
 import networkx as nx
 import plotly.graph_objects as go
 import plotly.express as px
+from events import ARRIVAL, DEPARTURE
+from event_list import make_event_list
+from server_pool import FreeServerPool
+from routing import RoutingTable
+from variates import ARRIVALS, SERVICE, ROUTING, RandomStreams
+from recorder import DepartureRecorder
 
 class Agent:
     def __init__(self, arrival_time, agent_id):
@@ -24,39 +30,48 @@ class Server:
         self.current_agent = None
 
 class Queue:
-    def __init__(self, queue_id, num_servers, service_rate):
+    def __init__(self, queue_id, num_servers, service_rate, service_stream=None):
         self.queue_id = queue_id
         self.servers = [Server(i) for i in range(num_servers)]
+        self.free_servers = FreeServerPool(num_servers)  # Ids of the idle servers
         self.service_rate = service_rate
-        self.queue = []  # Queue of agents waiting to be served
+        self.queue = deque()  # Queue of agents waiting to be served
+        if service_stream is None:
+            service_stream = RandomStreams().exponential(service_rate, SERVICE, queue_id)
+        self.service_stream = service_stream  # Buffered exponential service times
 
     def generate_service_time(self):
         # Generate service time using exponential distribution
-        return np.random.exponential(1.0 / self.service_rate)
+        return self.service_stream.draw()
 
 class ClosedQueueNetwork:
-    def __init__(self, arrival_rate, service_rates, max_time, num_servers, prob_matrix):
+    def __init__(self, arrival_rate, service_rates, max_time, num_servers, prob_matrix, event_list='heap', seed=None):
         self.arrival_rate = arrival_rate
         self.service_rates = service_rates
         self.max_time = max_time
         self.num_servers = num_servers
         self.prob_matrix = prob_matrix
-        self.queues = [Queue(i, num_servers[i], service_rates[i]) for i in range(len(num_servers))]
+        self.streams = RandomStreams(seed)  # seed=None follows np.random.seed()
+        self.interarrival_stream = self.streams.exponential(arrival_rate, ARRIVALS)
+        self.routing_streams = [self.streams.uniform(ROUTING, i) for i in range(len(num_servers))]
+        self.routing = RoutingTable(prob_matrix)  # alias tables compiled once
+        self.queues = [Queue(i, num_servers[i], service_rates[i], self.streams.exponential(service_rates[i], SERVICE, i))
+                       for i in range(len(num_servers))]
         self.time = 0  # Current simulation time
-        self.event_queue = []  # Priority queue for managing events
-        self.agents_data = []  # List to store data about each agent
+        self.event_queue = make_event_list(event_list)  # Pending events ('heap', 'calendar' or 'ladder')
+        self.agents_data = DepartureRecorder(('agent_id', 'queue_id', 'arrival', 'service_start', 'departure', 'queue_length_on_arrival', 'server_id'))  # departure records, one row per departure
         self.agent_counter = 0  # Counter for generating unique agent IDs
         self.network = nx.DiGraph()  # Directed graph for visualization
         self.agent_paths = {}  # To store the paths of each agent
     
     def generate_interarrival_time(self):
         # Generate interarrival time using exponential distribution
-        return np.random.exponential(1.0 / self.arrival_rate)
+        return self.interarrival_stream.draw()
     
     def advance_time(self):
         # Advance the simulation time by processing the next event
         if self.event_queue:
-            self.time, event_type, agent, queue_id = heapq.heappop(self.event_queue)
+            self.time, event_type, _, agent, queue_id = self.event_queue.pop()
             if self.time > self.max_time:
                 return False, None, None, None
             return True, event_type, agent, queue_id
@@ -66,7 +81,8 @@ class ClosedQueueNetwork:
         # Handle the arrival of an agent at a specific queue
         queue = self.queues[queue_id]
         agent.queue_length_on_arrival = len(queue.queue)
-        free_server = next((server for server in queue.servers if not server.is_busy), None)
+        free_server_id = queue.free_servers.acquire()
+        free_server = queue.servers[free_server_id] if free_server_id is not None else None
         if free_server:
             # Assign the agent to the free server
             free_server.is_busy = True
@@ -75,7 +91,7 @@ class ClosedQueueNetwork:
             agent.server_id = free_server.server_id
             service_time = queue.generate_service_time()
             agent.departure_time = self.time + service_time
-            heapq.heappush(self.event_queue, (agent.departure_time, 'departure', agent, queue_id))
+            self.event_queue.push(agent.departure_time, DEPARTURE, agent, queue_id)
         else:
             # All servers are busy, so the agent joins the queue
             queue.queue.append(agent)
@@ -83,7 +99,7 @@ class ClosedQueueNetwork:
     def handle_departure(self, agent, queue_id):
         # Handle the departure of an agent from a specific queue
         queue = self.queues[queue_id]
-        self.agents_data.append([
+        self.agents_data.record(
             agent.agent_id,
             queue_id,
             agent.arrival_time,
@@ -91,7 +107,7 @@ class ClosedQueueNetwork:
             agent.departure_time,
             agent.queue_length_on_arrival,
             agent.server_id
-        ])
+        )
         
         server = queue.servers[agent.server_id]
         server.is_busy = False
@@ -99,28 +115,28 @@ class ClosedQueueNetwork:
         
         if queue.queue:
             # Start service for the next agent in queue
-            next_agent = queue.queue.pop(0)
+            next_agent = queue.queue.popleft()
             server.is_busy = True
             server.current_agent = next_agent
             next_agent.service_start_time = self.time
             next_agent.server_id = server.server_id
             service_time = queue.generate_service_time()
             next_agent.departure_time = self.time + service_time
-            heapq.heappush(self.event_queue, (next_agent.departure_time, 'departure', next_agent, queue_id))
+            self.event_queue.push(next_agent.departure_time, DEPARTURE, next_agent, queue_id)
+        else:
+            queue.free_servers.release(server.server_id)
         
         # Determine the next queue for the agent based on the probability matrix
         next_queue_id = self.next_queue(queue_id)
         if next_queue_id is not None:
             next_arrival_time = self.time
             agent.arrival_time = next_arrival_time
-            heapq.heappush(self.event_queue, (next_arrival_time, 'arrival', agent, next_queue_id))
+            self.event_queue.push(next_arrival_time, ARRIVAL, agent, next_queue_id)
             self.record_transition(agent, queue_id, next_queue_id)
     
     def next_queue(self, current_queue_id):
         # Determine the next queue based on the probability matrix
-        probabilities = self.prob_matrix[current_queue_id]
-        next_queue_id = np.random.choice(len(probabilities), p=probabilities)
-        return next_queue_id
+        return self.routing.sample(current_queue_id, self.routing_streams[current_queue_id].draw())
     
     def record_transition(self, agent, from_queue_id, to_queue_id):
         # Record the transition of an agent from one queue to another
@@ -135,23 +151,23 @@ class ClosedQueueNetwork:
         agent = Agent(arrival_time, self.agent_counter)
         self.agent_counter += 1
         initial_queue_id = 0  # Assuming the first agent starts at queue 0
-        heapq.heappush(self.event_queue, (arrival_time, 'arrival', agent, initial_queue_id))
+        self.event_queue.push(arrival_time, ARRIVAL, agent, initial_queue_id)
         
         while True:
             continue_simulation, event_type, agent, queue_id = self.advance_time()
             if not continue_simulation:
                 break
             
-            if event_type == 'arrival':
+            if event_type == ARRIVAL:
                 self.handle_arrival(agent, queue_id)
-            elif event_type == 'departure':
+            elif event_type == DEPARTURE:
                 self.handle_departure(agent, queue_id)
 
-        return np.array(self.agents_data)
+        return self.agents_data.data()
 
     def visualize_queue_lengths(self):
         # Convert data to a numpy array for easier handling
-        data = np.array(self.agents_data)
+        data = self.agents_data.data()
         agent_ids = data[:, 0]
         queue_ids = data[:, 1]
         arrival_times = data[:, 2]
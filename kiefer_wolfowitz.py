@@ -0,0 +1,180 @@
+"""
+Event-free engine for a single FCFS station with c servers and no blocking.
+
+Kiefer and Wolfowitz: with the customers taken in arrival order, the start of
+service of customer k is max(A_k, earliest time a server frees up after
+customers 0..k-1 were placed). free_times runs that recursion over a heap of
+plain floats, chunk by chunk, and everything else is worked out from its result
+with NumPy: who waited, the server each customer gets (lowest idle id first) and
+the queue length on arrival, with the time ties handled as the event simulation
+in Series_system/M_M_s.py handles them.
+
+Arrival and service times are drawn as NumPy arrays from the same RandomStreams
+as MMmQueue, so for the same seed both give the same agents_data.
+"""
+import heapq
+
+import numpy as np
+
+from tandem import arrival_times
+from variates import ARRIVALS, SERVICE, RandomStreams
+
+# column order of the agents_data of MMmQueue in Series_system/M_M_s.py
+MMS_COLUMNS = ('arrival', 'service_start', 'departure', 'queue_length_on_arrival', 'server_id', 'agent_id')
+
+
+def free_times(arrivals, services, num_servers, chunk_size=65536):
+    """
+    Returns the time the first server frees up, as seen by each customer on arrival
+
+    The workload vector is kept as a heap of the num_servers free times, -inf while a server
+    has never been busy. Customer k starts at max(A_k, min of the heap) and replaces that minimum
+    by its departure time
+    """
+    n = len(arrivals)
+    free = np.empty(n)
+    heapreplace = heapq.heapreplace
+    workload = [-np.inf] * num_servers
+    for first in range(0, n, chunk_size):
+        last = min(first + chunk_size, n)
+        chunk = []
+        append = chunk.append
+        for arrival, service in zip(arrivals[first:last].tolist(), services[first:last].tolist()):
+            earliest = workload[0]
+            append(earliest)
+            heapreplace(workload, (earliest if earliest >= arrival else arrival) + service)
+        free[first:last] = chunk
+    return free
+
+
+def assign_servers(arrivals, departures, waited, num_servers):
+    """
+    Returns the server each customer is served by, as MMmQueue assigns them
+
+    A departure frees its server either to the idle servers or to the first customer in line.
+    The heap of the event simulation hands out the departures in (departure, scheduled) order,
+    so after the idle servers of customer k were released, popped[k] departures are gone:
+    the ones before A_k and, if k waits, the one it takes. A waiting customer keeps the server
+    of the customer it takes the place of, and only the customers that start on arrival take
+    the lowest idle server, so only those go through the bitmap of server_pool.FreeServerPool
+    """
+    n = len(arrivals)
+    customers = np.arange(n)
+    order = np.argsort(departures, kind='stable')
+    released = np.searchsorted(departures[order], arrivals, side='left')
+    popped = np.maximum.accumulate(np.maximum(released, customers + 1 - num_servers))
+    before = np.concatenate(([0], popped[:-1]))
+    # every waiting customer points at the customer it follows on the same server,
+    # pointer jumping takes each of them to the customer that started on arrival there
+    root = np.where(waited, order[np.maximum(popped - 1, 0)], customers)
+    while True:
+        jumped = root[root]
+        if np.array_equal(jumped, root):
+            break
+        root = jumped
+
+    immediate = np.flatnonzero(~waited)
+    rank = np.cumsum(~waited) - 1  # index among the customers that started on arrival
+    leaving = rank[root[order]].tolist()
+    server_ids = []
+    append = server_ids.append
+    idle = (1 << num_servers) - 1
+    for first, last in zip(before[immediate].tolist(), popped[immediate].tolist()):
+        for customer in leaving[first:last]:
+            idle |= 1 << server_ids[customer]
+        lowest = idle & -idle
+        idle ^= lowest
+        append(lowest.bit_length() - 1)
+    return np.array(server_ids, dtype=np.int64)[rank[root]]
+
+
+def place_customers(arrivals, services, num_servers, chunk_size=65536, servers=True):
+    """
+    Returns (service_start, departure, server_id, waited) of FCFS customers
+
+    waited[k] is True if customer k found every server busy on arrival
+    (a server freeing at the arrival instant counts as busy: arrivals are handled first)
+    servers: False to skip the server ids, server_id is None then
+    """
+    free = free_times(arrivals, services, num_servers, chunk_size)
+    waited = free >= arrivals
+    starts = np.where(waited, free, arrivals)
+    departures = starts + services
+    server_ids = assign_servers(arrivals, departures, waited, num_servers) if servers else None
+    return starts, departures, server_ids, waited
+
+
+def waiting_on_arrival(arrivals, starts, waited):
+    """
+    Number of customers waiting in line when each customer arrives, as len(self.queue) in MMmQueue.
+    Service starts are non-decreasing under FCFS. A customer that starts exactly at the arrival
+    instant because a server freed then was still in line, since the arrival is handled first
+    """
+    count = np.arange(len(arrivals))
+    before = np.searchsorted(starts, arrivals, side='left')
+    at_or_before = np.minimum(np.searchsorted(starts, arrivals, side='right'), count)
+    queued = np.concatenate(([0], np.cumsum(waited)))
+    return count - at_or_before + queued[at_or_before] - queued[np.minimum(before, at_or_before)]
+
+
+def event_rows(arrivals, departures, server_ids, waited, waiting, max_time, num_servers):
+    """
+    Returns the (events, 4) rows MMmQueue.simulate logs to master_queue, in the order the events are handled:
+    [time, 0, server_id + 1 (1 if the agent waits), queue length] per arrival and
+    [time, server_id + 1, num_servers + 1, 0] per departure up to max_time
+    """
+    n = len(arrivals)
+    departed = np.flatnonzero(departures <= max_time)
+    rows = np.zeros((n + len(departed), 4))
+    rows[:n, 0] = arrivals
+    rows[:n, 2] = np.where(waited, 1, server_ids + 1)
+    rows[:n, 3] = waiting
+    rows[n:, 0] = departures[departed]
+    rows[n:, 1] = server_ids[departed] + 1
+    rows[n:, 2] = num_servers + 1
+    # arrivals first on a time tie, departures in the order they were scheduled
+    kind = np.concatenate((np.zeros(n), np.ones(len(departed))))
+    order = np.lexsort((np.concatenate((np.arange(n), departed)), kind, rows[:, 0]))
+    return rows[order]
+
+
+def simulate_fcfs(arrival_rate, service_rate, max_time, num_servers, seed=None, block_size=4096, chunk_size=65536,
+                  servers=True, events=False):
+    """
+    Simulates an M/M/c FCFS station without blocking
+
+    Parameters:
+    arrival_rate: arrival rate
+    service_rate: service rate of each server
+    max_time: The max simulation time, departures after it are not recorded
+    num_servers: The number of servers
+    seed: int or numpy SeedSequence of the random streams, see variates.RandomStreams
+    block_size: block size of the streams
+    chunk_size: number of customers placed per chunk
+    servers: False to skip assigning the servers, the server_id column is NaN then
+    events: if True, also return the master_queue rows of MMmQueue (see event_rows), needs servers
+
+    Returns:
+    array (departures, 6) in the agents_data layout of MMmQueue (MMS_COLUMNS),
+    rows ordered by departure time, or (agents_data, event rows) if events is True
+    """
+    if events and not servers:
+        raise ValueError("The master_queue rows need the server ids, use servers=True")
+    streams = RandomStreams(seed, block_size)
+    arrivals = arrival_times(streams.exponential(arrival_rate, ARRIVALS, decimals=3), max_time, arrival_rate)
+    services = streams.exponential(service_rate, SERVICE, decimals=3).draw_many(len(arrivals))
+    starts, departures, server_ids, waited = place_customers(arrivals, services, num_servers, chunk_size, servers)
+    waiting = waiting_on_arrival(arrivals, starts, waited)
+    recorded = departures <= max_time
+    data = np.empty((np.count_nonzero(recorded), len(MMS_COLUMNS)))
+    data[:, 0] = arrivals[recorded]
+    data[:, 1] = starts[recorded]
+    data[:, 2] = departures[recorded]
+    data[:, 3] = waiting[recorded]
+    data[:, 4] = server_ids[recorded] if servers else np.nan
+    data[:, 5] = np.flatnonzero(recorded) + 1
+    # departures at the same time in the order they were scheduled: the customers start in arrival order
+    order = np.argsort(data[:, 2], kind='stable')
+    if events:
+        return data[order], event_rows(arrivals, departures, server_ids, waited, waiting, max_time, num_servers)
+    return data[order]
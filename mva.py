@@ -0,0 +1,217 @@
+"""
+Mean Value Analysis of closed networks.
+
+A closed network of product form is solved without simulating it. Station i
+is described by its service demand D_i = v_i / mu_i, the mean work an agent
+brings it per cycle (v_i visits of mean length 1 / mu_i), and its number of
+servers c_i. Agents come back to queue 0 through a delay station, the
+cycle_delay of Closed_network.OpenQueueNetwork, which has no queue.
+
+Exact MVA goes up the populations n = 1 .. N, O(N M) for M stations:
+
+    R_i(n) = D_i (1 + Q_i(n - 1))     residence time per cycle
+    X(n) = n / sum_i R_i(n)           cycles per unit time
+    Q_i(n) = X(n) R_i(n)              mean number of agents at station i
+
+A delay station has R_i(n) = D_i. A station with c > 1 servers is solved with
+Seidmann's correction, a single server of demand D / c followed by a delay of
+D (c - 1) / c. It is exact at c = 1, for a delay and for a single agent, and
+underestimates the throughput in between, the most around the population
+where the c servers saturate: for c = 3 next to a delay station, checked
+against the exact birth-death solution, the throughput is 5 to 10% low over
+most populations and up to 30% low at the knee when the delay is short.
+Simulate such stations when their throughput matters to better than that.
+
+Approximate MVA (Schweitzer, Bard) replaces Q_i(n - 1) by (n - 1) / n Q_i(n)
+(Schweitzer) or by Q_i(n) (Bard) and solves the fixed point at each population
+on its own, so a few populations of a large N are solved without going through
+all the smaller ones.
+
+    demands, num_servers = network_demands(service_rates, num_servers, prob_matrix, cycle_delay)
+    results = exact_mva(demands, 10000, num_servers)
+    results['throughput'][n], results['queue_lengths'][n, i], results['residence_times'][n, i]
+"""
+import math
+
+import numpy as np
+
+
+def visit_ratios(prob_matrix, reference=0):
+    """
+    Returns the mean number of visits to each queue per cycle, a cycle starting
+    at the queue reference and ending when the agent is back there or leaves the
+    network (the probability mass missing from the rows, see routing.py)
+
+    prob_matrix: list of rows or 2D array, prob_matrix[i][j] the probability to move from queue i to queue j
+    """
+    routing = np.asarray(prob_matrix, dtype=np.float64)
+    n = routing.shape[0]
+    routing = routing[:, :n].copy()
+    # a move back to the reference queue starts the next cycle
+    routing[:, reference] = 0.0
+    start = np.zeros(n)
+    start[reference] = 1.0
+    return np.linalg.solve(np.eye(n) - routing.T, start)
+
+
+def network_demands(service_rates, num_servers, prob_matrix, cycle_delay=0.0, reference=0):
+    """
+    Returns (demands, num_servers) of a closed network with the layout of the simulators:
+    the queues, then the delay station of cycle_delay (num_servers inf) if cycle_delay > 0.
+
+    Agents that leave the network wait cycle_delay and come back at queue reference,
+    so the delay station is visited by the part of the cycles that leave the network.
+    """
+    visits = visit_ratios(prob_matrix, reference)
+    demands = visits / np.asarray(service_rates, dtype=np.float64)
+    num_servers = np.asarray(num_servers, dtype=np.float64)
+    if cycle_delay > 0:
+        routing = np.asarray(prob_matrix, dtype=np.float64)[:, :len(visits)]
+        exits = visits @ (1.0 - routing.sum(axis=1))
+        demands = np.append(demands, exits * cycle_delay)
+        num_servers = np.append(num_servers, math.inf)
+    return demands, num_servers
+
+
+def split_demands(demands, num_servers=None):
+    """
+    Returns (queueing, delay): the part of each demand that queues and the part that does not,
+    Seidmann's correction for the stations with several servers, all of it delay for num_servers inf
+    """
+    demands = np.asarray(demands, dtype=np.float64)
+    if num_servers is None:
+        return demands, np.zeros(demands.shape)
+    num_servers = np.asarray(num_servers, dtype=np.float64)
+    queueing = np.where(np.isinf(num_servers), 0.0, demands / num_servers)
+    return queueing, demands - queueing
+
+
+def mva_results(populations, queueing, delay, residence_times, num_servers):
+    """
+    The results of exact_mva and approximate_mva from the residence times at each population
+    """
+    cycle_time = residence_times.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        throughput = np.where(populations > 0, populations / cycle_time, 0.0)
+    demands = queueing + delay
+    if num_servers is None:
+        busy = demands
+    else:
+        num_servers = np.asarray(num_servers, dtype=np.float64)
+        # a delay station has no servers to be busy
+        busy = np.where(np.isinf(num_servers), 0.0, demands / num_servers)
+    return {
+        'population': populations,
+        'throughput': throughput,
+        'cycle_time': cycle_time,
+        'queue_lengths': throughput[:, None] * residence_times,
+        'residence_times': residence_times,
+        'utilization': throughput[:, None] * busy
+    }
+
+
+def exact_mva(demands, population, num_servers=None):
+    """
+    Exact MVA for every population 0 .. population
+
+    Parameters:
+    demands: service demand of each station per cycle, see network_demands
+    population: N, the number of agents
+    num_servers: number of servers of each station, inf for a delay station, None for single servers
+
+    Returns:
+    dict of arrays indexed by the population n (row) and the station (column):
+    'population' (n), 'throughput' X(n) in cycles per unit time, 'cycle_time' sum_i R_i(n),
+    'queue_lengths' Q_i(n), 'residence_times' R_i(n) per cycle and 'utilization' of each server
+    """
+    queueing, delay = split_demands(demands, num_servers)
+    residence_times = np.empty((population + 1, len(queueing)))
+    residence_times[0] = queueing + delay
+    queue_lengths = np.zeros(len(queueing))
+    for n in range(1, population + 1):
+        residence = queueing * (1.0 + queue_lengths) + delay
+        residence_times[n] = residence
+        queue_lengths = residence * (n / residence.sum())
+    return mva_results(np.arange(population + 1), queueing, delay, residence_times, num_servers)
+
+
+def approximate_mva(demands, populations, num_servers=None, method='schweitzer', tol=1e-12, max_iterations=200):
+    """
+    Schweitzer or Bard approximate MVA
+
+    Parameters:
+    demands, num_servers: see exact_mva
+    populations: int N for every population 0 .. N, or an array of the populations to solve
+    method: 'schweitzer', Q_i(n - 1) = (n - 1) / n Q_i(n), or 'bard', Q_i(n - 1) = Q_i(n)
+    tol: Newton stops when the queue lengths add up to n within tol * n
+    max_iterations: cap on the Newton steps
+
+    Returns:
+    dict of exact_mva, with one row per population
+
+    With Q_i(n - 1) = a Q_i(n), Q_i = X R_i gives Q_i = X D_i / (1 - a X q_i) for the
+    demands D_i and their queueing parts q_i, so the fixed point is the root X of
+    sum_i Q_i(X) = n, increasing in X. X is bracketed between 0
+    and min(n / sum_i D_i, 1 / (a max_i q_i)) and found by Newton steps, bisecting
+    when a step leaves the bracket; all the populations take their steps together.
+    """
+    if method not in ('schweitzer', 'bard'):
+        raise ValueError(f"Unknown method {method!r}, expected 'schweitzer' or 'bard'")
+    queueing, delay = split_demands(demands, num_servers)
+    populations = np.arange(populations + 1) if np.ndim(populations) == 0 else np.asarray(populations)
+    n = populations.astype(np.float64)
+    if method == 'schweitzer':
+        arrival_share = np.maximum(n - 1.0, 0.0) / np.maximum(n, 1.0)
+    else:
+        arrival_share = np.ones(n.shape)
+    demands = queueing + delay
+    throughput = np.zeros(n.shape)
+    low = np.zeros(n.shape)
+    with np.errstate(divide='ignore'):
+        high = np.minimum(n / demands.sum(), 1.0 / (arrival_share * queueing.max(initial=0.0)))
+    active = np.flatnonzero(n > 0)
+    # a step or a bracket end can land on the pole 1 - a X q_i = 0: inf and nan there are rejected by the bracket
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for _ in range(max_iterations):
+            x = throughput[active]
+            free = 1.0 - arrival_share[active, None] * x[:, None] * queueing
+            excess = x * (demands / free).sum(axis=1) - n[active]
+            unsolved = np.abs(excess) > tol * n[active]
+            active, x, free, excess = active[unsolved], x[unsolved], free[unsolved], excess[unsolved]
+            if len(active) == 0:
+                break
+            slope = (demands / free ** 2).sum(axis=1)
+            low[active] = np.where(excess < 0, x, low[active])
+            high[active] = np.where(excess > 0, x, high[active])
+            step = x - excess / slope
+            inside = (step > low[active]) & (step <= high[active])
+            throughput[active] = np.where(inside, step, 0.5 * (low[active] + high[active]))
+        residence_times = demands / (1.0 - arrival_share[:, None] * throughput[:, None] * queueing)
+    return mva_results(populations, queueing, delay, residence_times, num_servers)
+
+
+def solve_network(model, population=None, method='exact'):
+    """
+    MVA of a simulator of a closed network: Closed_network.OpenQueueNetwork (num_agents, cycle_delay)
+    or graph_visualization.ClosedQueueNetwork (no cycle delay, population must be given)
+
+    Parameters:
+    model: the simulator, only its service_rates, num_servers, prob_matrix and cycle_delay are read
+    population: N, defaults to model.num_agents
+    method: 'exact', 'schweitzer' or 'bard'
+
+    Returns:
+    dict of exact_mva, with the delay station of the cycle_delay (if any) as the last column,
+    plus 'visits', the visit ratios of the queues, and 'station_throughput', X(n) v_i of each queue
+    """
+    if population is None:
+        population = model.num_agents
+    demands, num_servers = network_demands(model.service_rates, model.num_servers, model.prob_matrix,
+                                           getattr(model, 'cycle_delay', 0.0))
+    if method == 'exact':
+        results = exact_mva(demands, population, num_servers)
+    else:
+        results = approximate_mva(demands, population, num_servers, method)
+    results['visits'] = visit_ratios(model.prob_matrix)
+    results['station_throughput'] = results['throughput'][:, None] * results['visits']
+    return results
@@ -1,12 +1,19 @@
+import os
+import sys
 import numpy as np
+from collections import deque
 from server import Server
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from server_pool import FreeServerPool
+
 class Queue:
     def __init__(self, queue_id, num_servers, service_rate):
         self.queue_id = queue_id
         self.servers = [Server(i) for i in range(num_servers)]
+        self.free_servers = FreeServerPool(num_servers)  # Ids of the idle servers
         self.service_rate = service_rate
-        self.queue = []  # Queue of agents waiting to be served
+        self.queue = deque()  # Queue of agents waiting to be served
 
     def generate_service_time(self):
         # Generate service time using exponential distribution
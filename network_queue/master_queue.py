@@ -1,6 +1,17 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tracing import TRANSITION, NULL_TRACER
+from node_index import NodeIndex
+
 class fetch_data():
-    def __init__(self) -> None:
+    def __init__(self, num_servers, tracer=None) -> None:
+        self.num_servers = num_servers
         self.master_queue = [(0, "source", "target", "event_type")]
+        self.node_index = NodeIndex(num_servers)  # (stage, server) -> node id of the graph, built once
+        self.tracer = tracer if tracer is not None else NULL_TRACER
+        self.trace_transitions = self.tracer.enabled(TRANSITION)
     
     def get_node(self):
         # Generate nodes and their positions
@@ -18,47 +29,32 @@ class fetch_data():
         Nodes.append(current_node_index)
         return Nodes, pos
 
-    def get_index_from_list(self, worker_number, stage_number, num_servers):
-    # Initialize the offset for the current stage
-        offset = 1  # Start from 1 because 0 is reserved for arrival
-        
-        # Calculate the offset by summing the number of servers in previous stages
-        for stage in range(stage_number):
-            offset += num_servers[stage]
-        
-        # The index in the list is the offset plus the worker number
-        index = offset + worker_number
-        print(f"Worker number: {worker_number}, Stage number: {stage_number}")
-        total_servers = sum(num_servers)
-        if index < 1 or index > total_servers:
-            raise ValueError(f"Invalid index: {index}. Worker number: {worker_number}, Stage number: {stage_number}")
-        
-        return index
-    
     def master_q(self,agent,queue_id, server_id, event_type):
-        Nodes, pos = self.get_node()
+        node = self.node_index.node
         server_id = agent.server_id if agent.server_id is not None else 0
 
         if event_type == "Arrival":
             if queue_id == 0:
-                source = Nodes[0]  # Arrival node
-                target = Nodes[self.get_index_from_list(server_id, queue_id, self.num_servers)]
+                source = self.node_index.source  # Arrival node
+                target = node(queue_id, server_id)
             else:
-                source = Nodes[self.get_index_from_list(server_id, queue_id - 1, self.num_servers)]
-                target = Nodes[self.get_index_from_list(server_id, queue_id, self.num_servers)]
+                source = node(queue_id - 1, server_id)
+                target = node(queue_id, server_id)
                 
             self.master_queue.append([self.time, source, target, 'arrival'])
             
-            print(f"Arrival - Time: {self.time}, Agent ID: {agent.agent_id}, Source: {source}, target: {target}, Queue ID: {queue_id}")
+            if self.trace_transitions:
+                self.tracer.emit(TRANSITION, self.time, agent.agent_id, queue_id, agent.server_id, source, target)
         else:  #deaprture
             if queue_id == len(self.num_servers) - 1:
-                source = Nodes[self.get_index_from_list(server_id, queue_id, self.num_servers)]
-                target = Nodes[-1]  # Departure node
+                source = node(queue_id, server_id)
+                target = self.node_index.sink  # Departure node
                 
             else:
-                source = Nodes[self.get_index_from_list(server_id, queue_id, self.num_servers)]
-                target = Nodes[self.get_index_from_list(server_id, queue_id + 1, self.num_servers)]
+                source = node(queue_id, server_id)
+                target = node(queue_id + 1, server_id)
             
-            print(f"Departure - Time: {self.time}, Agent ID: {agent.agent_id}, Source: {source}, target: {target}, Queue ID: {queue_id}")  
+            if self.trace_transitions:
+                self.tracer.emit(TRANSITION, self.time, agent.agent_id, queue_id, agent.server_id, source, target)
             
             self.master_queue.append([self.time, source, target, 'departure'])
\ No newline at end of file
@@ -1,11 +1,19 @@
+import os
+import sys
 import numpy as np
 from Queue_and_service import Queue
 from agent import Agent
 import heapq
 from master_queue import fetch_data
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from events import ARRIVAL, DEPARTURE
+from tracing import TRANSITION, NULL_TRACER
+from node_index import NodeIndex
+from recorder import DepartureRecorder
+
 class OpenQueueNetwork:
-    def __init__(self, arrival_rate, service_rates, max_time, num_servers, prob_matrix):
+    def __init__(self, arrival_rate, service_rates, max_time, num_servers, prob_matrix, tracer=None):
         self.arrival_rate = arrival_rate
         self.service_rates = service_rates
         self.max_time = max_time
@@ -14,11 +22,17 @@ class OpenQueueNetwork:
         self.queues = [Queue(i, num_servers[i], service_rates[i]) for i in range(len(num_servers))]
         self.time = 0  # Current simulation time
         self.event_queue = []  # Priority queue for managing events
-        self.agents_data = []  # List to store data about each agent
+        self.agents_data = DepartureRecorder()  # departure records, one row per departure
         self.agent_counter = 0  # Counter for generating unique agent IDs
         self.master_queue = [(0, "source", "target", "event_type")]
+        self.node_index = NodeIndex(num_servers)  # (stage, server) -> node id of the graph, built once
         self.arrival = 0
         self.departure = sum(num_servers) + 1
+        # Tracing flags are looked up once, the handlers only check the booleans
+        self.tracer = tracer if tracer is not None else NULL_TRACER
+        self.trace_arrivals = self.tracer.enabled(ARRIVAL)
+        self.trace_departures = self.tracer.enabled(DEPARTURE)
+        self.trace_transitions = self.tracer.enabled(TRANSITION)
      
     def generate_interarrival_time(self):
         # Generate interarrival time using exponential distribution
@@ -37,7 +51,8 @@ class OpenQueueNetwork:
         # Handle the arrival of an agent at a specific queue
         queue = self.queues[queue_id] 
         agent.queue_length_on_arrival = len(queue.queue)
-        free_server = next((server for server in queue.servers if not server.is_busy), None)
+        free_server_id = queue.free_servers.acquire()
+        free_server = queue.servers[free_server_id] if free_server_id is not None else None
         
         
         if free_server:
@@ -60,29 +75,31 @@ class OpenQueueNetwork:
             new_agent = Agent(next_arrival_time, self.agent_counter)
             heapq.heappush(self.event_queue, (next_arrival_time, 'arrival', new_agent, 0))
             
-        print(f"Arrival - Time: {self.time}, Agent ID: {agent.agent_id}, Assigned Server: {agent.server_id}, Queue ID: {queue_id}")
+        if self.trace_arrivals:
+            self.tracer.emit(ARRIVAL, self.time, agent.agent_id, queue_id, agent.server_id)
         
         
         # Capture the arrival event
-        Nodes = self.get_node()
+        node = self.node_index.node
         server_id = agent.server_id if agent.server_id is not None else 0
         if queue_id == 0:
-            source = Nodes[0]  # Arrival node
-            target = Nodes[self.get_index_from_list(server_id, queue_id, self.num_servers)]
+            source = self.node_index.source  # Arrival node
+            target = node(queue_id, server_id)
         else:
-            source = Nodes[self.get_index_from_list(server_id, queue_id - 1, self.num_servers)]
-            target = Nodes[self.get_index_from_list(server_id, queue_id, self.num_servers)]
+            source = node(queue_id - 1, server_id)
+            target = node(queue_id, server_id)
             
         self.master_queue.append([self.time, source, target, 'arrival'])
         
-        print(f"Arrival - Time: {self.time}, Agent ID: {agent.agent_id}, Source: {source}, target: {target}, Queue ID: {queue_id}")
+        if self.trace_transitions:
+            self.tracer.emit(TRANSITION, self.time, agent.agent_id, queue_id, agent.server_id, source, target)
     
     def handle_departure(self, agent, queue_id):
         # Handle the departure of an agent from a specific queue
         queue = self.queues[queue_id]
         
         #Log the departure
-        self.agents_data.append([
+        self.agents_data.record(
             agent.agent_id,
             agent.arrival_time,
             agent.service_start_time,
@@ -90,7 +107,7 @@ class OpenQueueNetwork:
             agent.server_id,
             queue_id,
             agent.queue_length_on_arrival
-        ])
+        )
         
         server = queue.servers[agent.server_id]
         server.is_busy = False
@@ -98,7 +115,7 @@ class OpenQueueNetwork:
         
         if queue.queue:
             # Start service for the next agent in queue
-            next_agent = queue.queue.pop(0)
+            next_agent = queue.queue.popleft()
             server.is_busy = True
             server.current_agent = next_agent
             next_agent.service_start_time = self.time
@@ -106,6 +123,8 @@ class OpenQueueNetwork:
             service_time = queue.generate_service_time()
             next_agent.departure_time = self.time + service_time
             heapq.heappush(self.event_queue, (next_agent.departure_time, 'departure', next_agent, queue_id))
+        else:
+            queue.free_servers.release(server.server_id)
         
         # Determine the next queue for the agent based on the probability matrix
         if queue_id != len(self.prob_matrix) - 1:
@@ -118,19 +137,21 @@ class OpenQueueNetwork:
                     agent.server_id = None  # Reset the server ID as it will be reassigned in the next stage
                 heapq.heappush(self.event_queue, (next_arrival_time, 'arrival', agent, next_queue_id))
         
-        print(f"Departure - Time: {self.time}, Agent ID: {agent.agent_id}, Released Server: {agent.server_id}, Queue ID: {queue_id}")
+        if self.trace_departures:
+            self.tracer.emit(DEPARTURE, self.time, agent.agent_id, queue_id, agent.server_id)
           
-        Nodes = self.get_node()
+        node = self.node_index.node
         server_id = agent.server_id if agent.server_id is not None else 0
         if queue_id == len(self.num_servers) - 1:
-            source = Nodes[self.get_index_from_list(server_id, queue_id, self.num_servers)]
-            target = Nodes[-1]  # Departure node
+            source = node(queue_id, server_id)
+            target = self.node_index.sink  # Departure node
             
         else:
-            source = Nodes[self.get_index_from_list(server_id, queue_id, self.num_servers)]
-            target = Nodes[self.get_index_from_list(server_id, queue_id + 1, self.num_servers)]
+            source = node(queue_id, server_id)
+            target = node(queue_id + 1, server_id)
         
-        print(f"Departure - Time: {self.time}, Agent ID: {agent.agent_id}, Source: {source}, target: {target}, Queue ID: {queue_id}")  
+        if self.trace_transitions:
+            self.tracer.emit(TRANSITION, self.time, agent.agent_id, queue_id, agent.server_id, source, target)
         
         self.master_queue.append([self.time, source, target, 'departure'])
     
@@ -139,37 +160,3 @@ class OpenQueueNetwork:
         probabilities = self.prob_matrix[current_queue_id]
         next_queue_id = np.random.choice(len(probabilities), p=probabilities)
         return next_queue_id if next_queue_id != len(probabilities) else None
-    
-    #function used for graph plotting
-    def get_node(self):
-        # Generate nodes and their positions
-        Nodes = [0]  # Start with the arrival node
-        pos = {0: (0, 0)}
-        current_node_index = 1
-
-        # Generate nodes and positions for each stage
-        for stage, num_servers in enumerate(self.num_servers):
-            for server in range(num_servers):
-                Nodes.append(current_node_index)
-                #pos[current_node_index] = (stage + 1, server)
-                current_node_index += 1
-        # Add departure node
-        Nodes.append(current_node_index)
-        return Nodes
-    
-    def get_index_from_list(self, worker_number, stage_number, num_servers):
-    # Initialize the offset for the current stage
-        offset = 1  # Start from 1 because 0 is reserved for arrival
-        
-        # Calculate the offset by summing the number of servers in previous stages
-        for stage in range(stage_number):
-            offset += num_servers[stage]
-        
-        # The index in the list is the offset plus the worker number
-        index = offset + worker_number
-        print(f"Worker number: {worker_number}, Stage number: {stage_number}")
-        total_servers = sum(num_servers)
-        if index < 1 or index > total_servers:
-            raise ValueError(f"Invalid index: {index}. Worker number: {worker_number}, Stage number: {stage_number}")
-        
-        return index
\ No newline at end of file
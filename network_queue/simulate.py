@@ -5,8 +5,8 @@ import numpy as np
 from master_queue import fetch_data
     
 class simulator():
-    def __init__(self, arrival_rate, service_rates, max_time, num_servers, prob_matrix):
-        self.network = OpenQueueNetwork(arrival_rate, service_rates, max_time, num_servers, prob_matrix)
+    def __init__(self, arrival_rate, service_rates, max_time, num_servers, prob_matrix, tracer=None):
+        self.network = OpenQueueNetwork(arrival_rate, service_rates, max_time, num_servers, prob_matrix, tracer)
  
     def simulate(self):
         # Schedule the first arrival
@@ -28,4 +28,4 @@ class simulator():
             elif event_type == 'departure':
                 self.network.handle_departure(agent, queue_id)
         
-        return np.array(self.network.agents_data), np.array(self.network.master_queue)
\ No newline at end of file
+        return self.network.agents_data.data(), np.array(self.network.master_queue)
\ No newline at end of file
@@ -0,0 +1,41 @@
+class NodeIndex:
+    """
+    Node ids of the network graph, computed once from num_servers.
+
+    Node 0 is the source (external arrivals), the servers of stage s are the
+    nodes offsets[s] .. offsets[s] + num_servers[s] - 1 and the last node is the
+    sink (departures out of the network).
+
+    Parameters:
+    num_servers: list of the number of servers of each stage
+
+    Attributes:
+    source: node id of the source
+    sink: node id of the sink
+    offsets: tuple- node id of server 0 of each stage
+    num_nodes: number of nodes, source and sink included
+    """
+    __slots__ = ('source', 'sink', 'offsets', 'num_nodes')
+
+    def __init__(self, num_servers):
+        offsets = []
+        offset = 1  # 0 is the source
+        for servers in num_servers:
+            offsets.append(offset)
+            offset += servers
+        self.source = 0
+        self.sink = offset
+        self.offsets = tuple(offsets)
+        self.num_nodes = offset + 1
+
+    def node(self, stage, server):
+        """
+        Returns the node id of a server of a stage
+        """
+        if 0 <= stage < len(self.offsets):
+            index = self.offsets[stage] + server
+            if 1 <= index < self.sink:
+                return index
+        else:
+            index = self.sink
+        raise ValueError(f"Invalid index: {index}. Worker number: {server}, Stage number: {stage}")
@@ -0,0 +1,79 @@
+"""
+Columnar recording of the departure records.
+
+The simulators used to append one Python list per departure to agents_data and
+convert the whole list with np.array() at the end of simulate(). A
+DepartureRecorder writes every record straight into a preallocated float64
+buffer and doubles the buffer when it is full, so the records are stored once and
+data() hands them out as a view.
+
+The buffer is Fortran ordered: every column is contiguous in memory, so
+data()[:, k] is as cheap to scan as a 1D array.
+"""
+import numpy as np
+
+# column order of the agents_data of the open network simulators, as read by
+# Jackson_network/analysis_data.py and by the column indices of Jackson_network/convert_data.py
+# (AGENT_ID 0, ARRIVAL_TIME 1, SERVICE_START_TIME 2, DEPARTURE_TIME 3, SERVER_ID 4, QUEUE_ID 5)
+AGENT_COLUMNS = ('agent_id', 'arrival', 'service_start', 'departure', 'server_id', 'queue_id', 'queue_length_on_arrival')
+
+
+class DepartureRecorder:
+    """
+    Parameters:
+    columns: names of the columns, in the order of the values passed to record()
+    capacity: number of records allocated up front
+    growth: factor the capacity grows by when the buffer is full
+    """
+    def __init__(self, columns=AGENT_COLUMNS, capacity=1024, growth=2):
+        self.columns = tuple(columns)
+        self.growth = growth
+        self.size = 0
+        self.buffer = np.empty((max(capacity, 1), len(self.columns)), dtype=np.float64, order='F')
+
+    def __len__(self):
+        return self.size
+
+    def __array__(self, dtype=None, copy=None):
+        # np.array(recorder) keeps working where agents_data used to be a list
+        data = self.data()
+        return data if dtype is None else data.astype(dtype)
+
+    def grow(self):
+        buffer = np.empty((len(self.buffer) * self.growth, len(self.columns)), dtype=np.float64, order='F')
+        buffer[:self.size] = self.buffer[:self.size]
+        self.buffer = buffer
+
+    def record(self, *values):
+        """
+        Stores one record, values in the order of columns
+        """
+        size = self.size
+        if size == len(self.buffer):
+            self.grow()
+        self.buffer[size] = values
+        self.size = size + 1
+
+    def extend(self, rows):
+        """
+        Stores a (records, columns) array of records at once
+        """
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, len(self.columns))
+        end = self.size + len(rows)
+        while end > len(self.buffer):
+            self.grow()
+        self.buffer[self.size:end] = rows
+        self.size = end
+
+    def data(self):
+        """
+        Returns the records as a (records, columns) view of the buffer, no copy.
+        The view stays valid after further records only if the buffer did not grow
+        """
+        return self.buffer[:self.size]
+
+    def column(self, name):
+        """
+        Returns one column by name as a 1D view
+        """
+        return self.buffer[:self.size, self.columns.index(name)]
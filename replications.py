@@ -0,0 +1,239 @@
+"""
+Independent replications of a simulator, run across a process pool.
+
+Every replication builds a fresh model with its own numpy SeedSequence, a
+child spawned from one root seed, so the replications are independent and the
+whole set is reproducible from that seed. Any simulator that takes a seed
+argument works, e.g. OpenQueueNetwork, MMmQueue (Series_system/M_M_s.py),
+JacksonNetwork or ClosedQueueNetwork:
+
+    from Jackson_network import JacksonNetwork
+    results = run_replications(JacksonNetwork, dict(num_queues=3, ...), station_statistics,
+                               replications=200, seed=2)
+    for name, (mean, half_width) in results.confidence_intervals().items():
+        print(f"{name}: {mean:.4f} +/- {half_width:.4f}")
+
+summarize(model, output) turns one finished replication into a dict of
+numbers. A worker sends back the names and the values, the values as the raw
+bytes of a float64 vector. The names of the first replication are kept for
+the whole set.
+
+Variance reduction:
+antithetic=True runs every seed twice, the second time with the uniforms U
+replaced by 1 - U (variates.Antithetic), and keeps the mean of each pair.
+compare_replications runs two configurations on the same seeds, so they draw
+the same arrivals, services and routing decisions (common random numbers), and
+returns the differences. ReplicationResults.control_variate_intervals corrects
+the means with summary values whose exact expectation is known, e.g. the M/M/c
+values of Series_system/theoretical_validation.py.
+"""
+import math
+import multiprocessing
+from statistics import NormalDist
+
+import numpy as np
+
+from variates import Antithetic, as_seed_sequence
+
+
+def t_quantile(p, df):
+    """
+    Returns the p quantile of Student's t distribution with df degrees of freedom (df = inf gives the normal quantile)
+
+    Exact with scipy. Without it, Hill's expansion around the normal quantile, accurate to about 1e-4
+    for df >= 5 but too small below (11.30 instead of 12.71 at p = 0.975, df = 1)
+    """
+    try:
+        from scipy.stats import t as student_t
+    except ImportError:
+        z = NormalDist().inv_cdf(p)
+        if df == math.inf:
+            return z
+        g1 = (z**3 + z) / 4
+        g2 = (5 * z**5 + 16 * z**3 + 3 * z) / 96
+        g3 = (3 * z**7 + 19 * z**5 + 17 * z**3 - 15 * z) / 384
+        g4 = (79 * z**9 + 776 * z**7 + 1482 * z**5 - 1920 * z**3 - 945 * z) / 92160
+        return z + g1 / df + g2 / df**2 + g3 / df**3 + g4 / df**4
+    return float(student_t.ppf(p, df))
+
+
+def confidence_interval(samples, confidence=0.95):
+    """
+    Returns (mean, half_width) of the t confidence interval of the mean of independent samples
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    n = len(samples)
+    mean = samples.mean()
+    if n < 2:
+        return mean, math.inf
+    half_width = t_quantile(0.5 + confidence / 2, n - 1) * samples.std(ddof=1) / math.sqrt(n)
+    return mean, half_width
+
+
+def station_statistics(model, output):
+    """
+    summarize for the models with get_statistics(): JacksonNetwork (one dict per station)
+    and MMmQueue of Series_system/M_M_s.py (one dict)
+    """
+    statistics = model.get_statistics()
+    if isinstance(statistics, dict):
+        return dict(statistics)
+    return {f"{key}[{i}]": value for i, station in enumerate(statistics) for key, value in station.items()}
+
+
+def departure_summary(model, output):
+    """
+    summarize for the models that record departures in a DepartureRecorder:
+    mean waiting time, mean time in service and number of departures of each queue
+    """
+    recorder = model.agents_data
+    data = recorder.data()
+    waits = data[:, recorder.columns.index('service_start')] - data[:, recorder.columns.index('arrival')]
+    services = data[:, recorder.columns.index('departure')] - data[:, recorder.columns.index('service_start')]
+    if 'queue_id' in recorder.columns:
+        queue_ids = data[:, recorder.columns.index('queue_id')]
+    else:
+        queue_ids = np.zeros(len(data))
+    summary = {}
+    for queue_id in np.unique(queue_ids):
+        at_queue = queue_ids == queue_id
+        summary[f"W_q[{int(queue_id)}]"] = waits[at_queue].mean()
+        summary[f"W_s[{int(queue_id)}]"] = services[at_queue].mean()
+        summary[f"departures[{int(queue_id)}]"] = float(at_queue.sum())
+    return summary
+
+
+def run_replication(task):
+    """
+    Runs one replication in a worker, returns (names, float64 bytes)
+    """
+    model_class, kwargs, summarize, seed = task
+    model = model_class(**kwargs, seed=seed)
+    output = model.simulate()
+    summary = summarize(model, output)
+    return tuple(summary), np.fromiter(summary.values(), dtype=np.float64, count=len(summary)).tobytes()
+
+
+class ReplicationResults:
+    """
+    names: names of the summary values
+    samples: array (replications, len(names)), one row per replication
+    """
+    def __init__(self, names, samples):
+        self.names = names
+        self.samples = samples
+
+    def means(self):
+        return dict(zip(self.names, self.samples.mean(axis=0)))
+
+    def confidence_intervals(self, confidence=0.95):
+        """
+        Returns {name: (mean, half_width)}
+        """
+        return {name: confidence_interval(self.samples[:, k], confidence) for k, name in enumerate(self.names)}
+
+    def control_variate_intervals(self, controls, confidence=0.95):
+        """
+        Returns {name: (mean, half_width)} of the other summary values, corrected by the controls
+
+        controls: dict name -> exact expectation of that summary value. The controls the summaries
+                  do not have are left out, so e.g. the full mmc_controls can be given to the results
+                  of departure_summary, which only has W_q[i] and W_s[i]
+        Every value Y is regressed on the controls C, Y = a + b (C - expectation) + error,
+        and the intercept a is the estimate, its interval from the least squares fit
+        with replications - len(controls) - 1 degrees of freedom. That is small for a
+        few replications, so the exact t quantile of t_quantile is used, never a normal
+        or large-df approximation
+        """
+        controls = {name: expectation for name, expectation in controls.items() if name in self.names}
+        if not controls:
+            raise ValueError(f"None of the controls is a summary value, the summary values are {self.names}")
+        columns = [self.names.index(name) for name in controls]
+        deviations = self.samples[:, columns] - np.fromiter(controls.values(), dtype=np.float64, count=len(controls))
+        n = len(self.samples)
+        design = np.column_stack((np.ones(n), deviations))
+        df = n - design.shape[1]
+        if df < 1:
+            raise ValueError(f"{n} replications are too few for {len(controls)} controls")
+        inverse = np.linalg.pinv(design.T @ design)
+        intervals = {}
+        for k, name in enumerate(self.names):
+            if name in controls:
+                continue
+            coefficients = inverse @ (design.T @ self.samples[:, k])
+            residuals = self.samples[:, k] - design @ coefficients
+            standard_error = math.sqrt(residuals @ residuals / df * inverse[0, 0])
+            intervals[name] = (coefficients[0], t_quantile(0.5 + confidence / 2, df) * standard_error)
+        return intervals
+
+
+def run_tasks(tasks, processes):
+    if processes == 1:
+        results = [run_replication(task) for task in tasks]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(run_replication, tasks, chunksize=max(1, len(tasks) // (4 * (processes or multiprocessing.cpu_count()))))
+    names = results[0][0]
+    samples = np.frombuffer(b"".join(values for _, values in results), dtype=np.float64).reshape(len(tasks), len(names))
+    return names, samples
+
+
+def replication_seeds(replications, seed, antithetic):
+    """
+    Returns the seeds of the runs: one child of the root seed per replication,
+    or per pair (child, Antithetic(child)) if antithetic
+    """
+    if not antithetic:
+        return as_seed_sequence(seed).spawn(replications)
+    if replications % 2:
+        raise ValueError("antithetic replications come in pairs, use an even number")
+    children = as_seed_sequence(seed).spawn(replications // 2)
+    return [run_seed for child in children for run_seed in (child, Antithetic(child))]
+
+
+def pair_means(samples, antithetic):
+    # the mean of each antithetic pair is one independent observation
+    return (samples[0::2] + samples[1::2]) / 2 if antithetic else samples
+
+
+def run_replications(model_class, kwargs, summarize, replications=200, seed=None, processes=None, antithetic=False):
+    """
+    Runs replications of model_class(**kwargs, seed=...) and collects their summaries
+
+    Parameters:
+    model_class: simulator class taking a seed argument, with a simulate() method
+    kwargs: dict of the other constructor arguments
+    summarize: function (model, output of simulate()) -> dict of numbers,
+               a module-level function so the workers can unpickle it
+    replications: number of replications
+    seed: root seed, int, SeedSequence or None (see variates.as_seed_sequence)
+    processes: size of the process pool, None for one per CPU, 1 to run in this process
+    antithetic: if True, the replications are replications / 2 antithetic pairs
+
+    Returns:
+    ReplicationResults, the rows in the order of the seeds whatever the pool did,
+    one row per pair (the mean of the two runs) if antithetic
+    """
+    seeds = replication_seeds(replications, seed, antithetic)
+    names, samples = run_tasks([(model_class, kwargs, summarize, run_seed) for run_seed in seeds], processes)
+    return ReplicationResults(names, pair_means(samples, antithetic))
+
+
+def compare_replications(model_class, kwargs, alternative, summarize, replications=200, seed=None, processes=None,
+                         antithetic=False):
+    """
+    Runs both configurations on the same seeds (common random numbers), e.g. 1 against 2 servers at a stage
+
+    Parameters:
+    kwargs: constructor arguments of the base configuration
+    alternative: dict of the arguments that change, over kwargs
+    the rest as run_replications
+
+    Returns:
+    ReplicationResults of the differences alternative - base, one row per seed (per pair if antithetic)
+    """
+    seeds = replication_seeds(replications, seed, antithetic)
+    tasks = [(model_class, configuration, summarize, run_seed)
+             for run_seed in seeds for configuration in (kwargs, {**kwargs, **alternative})]
+    names, samples = run_tasks(tasks, processes)
+    return ReplicationResults(names, pair_means(samples[1::2] - samples[0::2], antithetic))
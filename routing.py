@@ -0,0 +1,62 @@
+class RoutingTable:
+    """
+    A routing probability matrix compiled once into one alias table per row
+    (Walker's alias method, built with Vose's algorithm).
+
+    Parameters:
+    prob_matrix: list of rows or 2D array. prob_matrix[i][j] is the probability to move from queue i to column j.
+                 The probability mass missing from a row, 1 - sum(row), leaves the network
+
+    sample(row, u) turns one Uniform(0, 1) variate into the next column in O(1),
+    without re-validating the row like np.random.choice does on every call.
+    It returns None when the agent leaves the network.
+    """
+    def __init__(self, prob_matrix):
+        self.tables = [self.compile_row(row) for row in prob_matrix]
+
+    @staticmethod
+    def compile_row(row):
+        """
+        Returns (num_columns, threshold, outcome, alias) for one row.
+        Column k of the table yields outcome[k] if the fraction of u * num_columns is below
+        threshold[k], alias[k] otherwise
+        """
+        probabilities = [float(p) for p in row]
+        total = sum(probabilities)
+        outcomes = list(range(len(probabilities)))
+        if total < 1.0:
+            # exit column
+            probabilities.append(1.0 - total)
+            outcomes.append(None)
+            total = 1.0
+        num_columns = len(probabilities)
+        scaled = [p * num_columns / total for p in probabilities]
+        threshold = [1.0] * num_columns
+        alias = list(outcomes)
+        small = [k for k, p in enumerate(scaled) if p < 1.0]
+        large = [k for k, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            k = small.pop()
+            j = large.pop()
+            threshold[k] = scaled[k]
+            alias[k] = outcomes[j]
+            scaled[j] = scaled[j] + scaled[k] - 1.0
+            if scaled[j] < 1.0:
+                small.append(j)
+            else:
+                large.append(j)
+        # whatever is left over is 1 up to rounding
+        return num_columns, threshold, outcomes, alias
+
+    def sample(self, row, u):
+        """
+        Returns the next column for an agent leaving queue row, or None if it leaves the network
+
+        Parameters:
+        row: current queue id
+        u: a Uniform(0, 1) variate
+        """
+        num_columns, threshold, outcome, alias = self.tables[row]
+        x = u * num_columns
+        k = int(x)
+        return outcome[k] if x - k < threshold[k] else alias[k]
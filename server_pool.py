@@ -0,0 +1,36 @@
+class FreeServerPool:
+    """
+    The idle servers of a station, kept as a bitmap: bit i is set while server i is idle.
+
+    Parameters:
+    num_servers: The number of servers of the station, all idle at the start
+
+    acquire() hands out the lowest idle server id, the same server the old
+    linear scan over queue.servers picked, in a few integer operations
+    instead of one Python step per server.
+    """
+    __slots__ = ('bits',)
+
+    def __init__(self, num_servers):
+        self.bits = (1 << num_servers) - 1
+
+    def acquire(self):
+        """
+        Marks the lowest idle server busy and returns its id, or None if every server is busy
+        """
+        bits = self.bits
+        if not bits:
+            return None
+        lowest = bits & -bits
+        self.bits = bits ^ lowest
+        return lowest.bit_length() - 1
+
+    def release(self, server_id):
+        """
+        Marks the server idle again
+        """
+        self.bits |= 1 << server_id
+
+    def __len__(self):
+        # number of idle servers
+        return self.bits.bit_count()
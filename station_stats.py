@@ -0,0 +1,84 @@
+class StationStatistics:
+    """
+    Time-weighted statistics of one station, accumulated online.
+
+    The station reports its state, the number of agents waiting and the number
+    of busy servers, after every change. The accumulator integrates both over
+    time, so it keeps a handful of numbers however long the run is.
+
+    Parameters:
+    num_servers: The number of servers of the station
+    start_time: time the observation starts at
+
+    report(time) gives at any moment
+    L, L_q, L_s: time-average number in system, in queue and in service
+    utilization: L_s / num_servers
+    throughput: departures per unit time
+    W, W_q, W_s: L, L_q, L_s divided by the throughput (Little's law)
+    """
+    def __init__(self, num_servers, start_time=0.0):
+        self.num_servers = num_servers
+        self.start_time = start_time
+        self.last_time = start_time
+        self.in_queue = 0
+        self.busy = 0
+        self.area_in_queue = 0.0
+        self.area_busy = 0.0
+        self.arrivals = 0
+        self.departures = 0
+        self.blocked = 0
+
+    def advance(self, time):
+        """
+        Integrates the current state up to time
+        """
+        elapsed = time - self.last_time
+        if elapsed > 0:
+            self.area_in_queue += elapsed * self.in_queue
+            self.area_busy += elapsed * self.busy
+            self.last_time = time
+
+    def update(self, time, in_queue, busy):
+        """
+        The state changed at time: in_queue agents wait and busy servers work from now on
+        """
+        self.advance(time)
+        self.in_queue = in_queue
+        self.busy = busy
+
+    def arrival(self, time, in_queue, busy, blocked=False):
+        self.arrivals += 1
+        if blocked:
+            self.blocked += 1
+        self.update(time, in_queue, busy)
+
+    def departure(self, time, in_queue, busy):
+        self.departures += 1
+        self.update(time, in_queue, busy)
+
+    def report(self, time):
+        """
+        Returns the statistics of the interval from start_time to time
+        """
+        self.advance(time)
+        total_time = self.last_time - self.start_time
+        if total_time <= 0:
+            L_q = L_s = throughput = 0.0
+        else:
+            L_q = self.area_in_queue / total_time
+            L_s = self.area_busy / total_time
+            throughput = self.departures / total_time
+        L = L_q + L_s
+        return {
+            'L': L,
+            'L_q': L_q,
+            'L_s': L_s,
+            'W': L / throughput if throughput > 0 else 0,
+            'W_q': L_q / throughput if throughput > 0 else 0,
+            'W_s': L_s / throughput if throughput > 0 else 0,
+            'Utilization': L_s / self.num_servers,
+            'Throughput': throughput,
+            'Blocked customers': self.blocked,
+            'Total arrivals': self.arrivals,
+            'Total departures': self.departures
+        }
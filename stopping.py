@@ -0,0 +1,168 @@
+"""
+Sequential stopping: run until the confidence intervals are tight enough.
+
+Instead of running every configuration to the same max_time, a simulator given
+a SequentialStopping checks the selected metrics every check_every events and
+stops as soon as the batch-means confidence interval of each of them is within
+precision of its mean (relative half-width), or when a safety cap on the events
+or the wall-clock time is hit. max_time stays the hard horizon.
+
+    stopping = SequentialStopping({'W[0]': time_in_system(0), 'W[1]': time_in_system(1)}, precision=0.02)
+    network = OpenQueueNetwork(..., max_time=10**6, stopping=stopping)
+    network.simulate()
+    stopping.reason, stopping.intervals
+
+A metric is a function of the model returning its observations so far, in
+the order they were made, or (values, weights) for a time average whose
+observations cover intervals of different lengths. A metric that keeps state
+between checks has a reset() method, called when a run starts, so the same
+SequentialStopping can be given to several runs.
+"""
+import time
+
+import numpy as np
+
+from replications import confidence_interval
+
+
+def batch_means(values, num_batches=20, weights=None):
+    """
+    Returns the means of num_batches consecutive batches of the observations,
+    the observations left over at the start are dropped
+    """
+    values = np.asarray(values, dtype=np.float64)
+    size = len(values) // num_batches
+    if size == 0:
+        return np.empty(0)
+    skip = len(values) - size * num_batches
+    values = values[skip:].reshape(num_batches, size)
+    if weights is None:
+        return values.mean(axis=1)
+    weights = np.asarray(weights, dtype=np.float64)[skip:].reshape(num_batches, size)
+    return (values * weights).sum(axis=1) / weights.sum(axis=1)
+
+
+def batch_means_interval(values, num_batches=20, confidence=0.95, weights=None):
+    """
+    Returns (mean, half_width) of the batch-means confidence interval
+    """
+    means = batch_means(values, num_batches, weights)
+    if len(means) < num_batches:
+        return np.mean(values) if len(values) else 0.0, np.inf
+    return confidence_interval(means, confidence)
+
+
+def time_in_system(queue_id=None):
+    """
+    Metric W: time in system of the departed agents of model.agents_data, at one queue_id of the open networks
+    or at station queue_id of JacksonNetwork; None for the single station of MMmQueue
+    """
+    def observations(model):
+        if hasattr(model, 'queues') and hasattr(model.queues[0], 'agents_data'):
+            # JacksonNetwork: one recorder per station
+            recorder = model.queues[queue_id].agents_data
+        else:
+            recorder = model.agents_data
+        data = recorder.data()
+        sojourns = data[:, recorder.columns.index('departure')] - data[:, recorder.columns.index('arrival')]
+        if 'queue_id' in recorder.columns:
+            sojourns = sojourns[data[:, recorder.columns.index('queue_id')] == queue_id]
+        return sojourns
+    return observations
+
+
+class TimeAverage:
+    """
+    Metric L: number in system of a station with a StationStatistics (self.stats),
+    averaged over each interval between two checks
+
+    Parameters:
+    station: index in model.queues (JacksonNetwork), None for the model itself (MMmQueue)
+    """
+    def __init__(self, station=None):
+        self.station = station
+        self.reset()
+
+    def reset(self):
+        self.last_area = 0.0
+        self.last_time = None
+        self.values = []
+        self.durations = []
+
+    def __call__(self, model):
+        stats = model.stats if self.station is None else model.queues[self.station].stats
+        stats.advance(model.time)
+        area = stats.area_in_queue + stats.area_busy
+        if self.last_time is None:
+            self.last_time = stats.start_time
+        duration = stats.last_time - self.last_time
+        if duration > 0:
+            self.values.append((area - self.last_area) / duration)
+            self.durations.append(duration)
+            self.last_area = area
+            self.last_time = stats.last_time
+        return self.values, self.durations
+
+
+class SequentialStopping:
+    """
+    Parameters:
+    metrics: dict name -> metric function (see time_in_system and TimeAverage)
+    precision: target half-width relative to the mean
+    confidence: confidence level of the intervals
+    num_batches: number of batches of the batch-means intervals
+    check_every: number of events between two checks, a check costs time linear in the observations so far
+    max_events: stop after that many events whatever the precision, None for no cap
+    max_wall_time: stop after that many seconds whatever the precision, None for no cap
+
+    After the run:
+    intervals: dict name -> (mean, half_width) at the last check
+    events: number of events run
+    reason: 'precision', 'events' or 'wall time', None if the run reached max_time
+    """
+    def __init__(self, metrics, precision=0.05, confidence=0.95, num_batches=20, check_every=10000,
+                 max_events=None, max_wall_time=None):
+        self.metrics = metrics
+        self.precision = precision
+        self.confidence = confidence
+        self.num_batches = num_batches
+        self.check_every = check_every
+        self.max_events = max_events
+        self.max_wall_time = max_wall_time
+        self.intervals = {}
+        self.events = 0
+        self.reason = None
+        self.started = None
+
+    def start(self):
+        """
+        Called by the simulator before its first event, clears what the previous run left
+        """
+        self.started = time.perf_counter()
+        self.reason = None
+        self.intervals = {}
+        self.events = 0
+        for metric in self.metrics.values():
+            if hasattr(metric, 'reset'):
+                metric.reset()
+
+    def check(self, model, events):
+        """
+        Called by the simulator every check_every events, returns True to stop the run
+        """
+        self.events = events
+        precise = True
+        for name, metric in self.metrics.items():
+            observations = metric(model)
+            values, weights = observations if isinstance(observations, tuple) else (observations, None)
+            mean, half_width = batch_means_interval(values, self.num_batches, self.confidence, weights)
+            self.intervals[name] = (mean, half_width)
+            if not half_width <= self.precision * abs(mean):
+                precise = False
+        if precise:
+            self.reason = 'precision'
+        elif self.max_events is not None and events >= self.max_events:
+            self.reason = 'events'
+        elif self.max_wall_time is not None and time.perf_counter() - self.started >= self.max_wall_time:
+            self.reason = 'wall time'
+        return self.reason is not None
@@ -0,0 +1,123 @@
+"""
+Parameter sweeps with an on-disk cache of the results.
+
+Every point of a sweep is one run of a simulator with some constructor
+arguments changed. Its summary is written to cache_dir under a hash of the
+simulator, the full arguments, the summarize function and the seed, so running
+the sweep again, or a larger grid that overlaps it, only runs the points that
+are not on disk yet:
+
+    from Open_network_queue import OpenQueueNetwork
+    from replications import departure_summary
+    points = grid(arrival_rate=[0.5, 1.0], service_rates=[[1.5, 1.5, 2, 2], [3, 3, 4, 4]])
+    results = run_sweep(OpenQueueNetwork, base_kwargs, points, departure_summary, seed=2)
+
+The seed must be reproducible for the cache to hit (an int, a SeedSequence,
+e.g. a spawned child, or an Antithetic of one): seed=None draws a new root seed
+on every call. The key holds the entropy, the spawn key and the antithetic flag
+of the seed, so two children of one SeedSequence never share a result.
+"""
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+
+import numpy as np
+
+from replications import run_replication
+from variates import Antithetic, as_seed_sequence
+
+
+def grid(**axes):
+    """
+    Returns the cartesian product of the axes as a list of dicts, e.g.
+    grid(arrival_rate=[1, 2], num_servers=[[1, 1], [2, 2]]) gives 4 points
+    """
+    names = list(axes)
+    return [dict(zip(names, values)) for values in itertools.product(*(axes[name] for name in names))]
+
+
+def to_json(value):
+    # numpy scalars and arrays in the arguments
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot hash argument of type {type(value).__name__}")
+
+
+def point_key(model_class, kwargs, summarize, seed_sequence, antithetic=False):
+    """
+    Returns the hex digest the result of a point is cached under
+    """
+    description = {
+        'model': f"{model_class.__module__}.{model_class.__qualname__}",
+        'kwargs': kwargs,
+        'summarize': f"{summarize.__module__}.{summarize.__qualname__}",
+        'seed': {
+            'entropy': seed_sequence.entropy,
+            'spawn_key': list(seed_sequence.spawn_key),
+            'antithetic': antithetic,
+        },
+    }
+    text = json.dumps(description, sort_keys=True, default=to_json)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def load_point(path):
+    with open(path) as file:
+        return json.load(file)['summary']
+
+
+def store_point(path, kwargs, summary):
+    # write to a temporary file first so an interrupted sweep never leaves half a result
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'w') as file:
+        json.dump({'kwargs': kwargs, 'summary': summary}, file, default=to_json)
+    os.replace(temporary, path)
+
+
+def run_sweep(model_class, base_kwargs, points, summarize, seed=None, cache_dir='sweep_cache', processes=None):
+    """
+    Runs model_class(**base_kwargs, **point, seed=...) for every point that is not cached yet
+
+    Parameters:
+    model_class: simulator class taking a seed argument, with a simulate() method
+    base_kwargs: dict of the constructor arguments shared by every point
+    points: list of dicts of the arguments that change, e.g. from grid()
+    summarize: function (model, output of simulate()) -> dict of numbers (see replications.py)
+    seed: root seed, int, SeedSequence or Antithetic (see variates.as_seed_sequence),
+          every point runs with the same streams (common random numbers)
+    cache_dir: directory of the cached results
+    processes: size of the process pool, None for one per CPU, 1 to run in this process
+
+    Returns:
+    list of (point, summary) in the order of points
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    seed_sequence = as_seed_sequence(seed)
+    antithetic = isinstance(seed, Antithetic)
+    run_seed = Antithetic(seed_sequence) if antithetic else seed_sequence
+    paths = []
+    tasks = []
+    missing = []
+    for index, point in enumerate(points):
+        kwargs = {**base_kwargs, **point}
+        path = os.path.join(cache_dir, point_key(model_class, kwargs, summarize, seed_sequence, antithetic) + '.json')
+        paths.append(path)
+        if not os.path.exists(path):
+            tasks.append((model_class, kwargs, summarize, run_seed))
+            missing.append(index)
+
+    if tasks:
+        if processes == 1 or len(tasks) == 1:
+            results = [run_replication(task) for task in tasks]
+        else:
+            with multiprocessing.Pool(processes) as pool:
+                results = pool.map(run_replication, tasks)
+        for index, task, (names, values) in zip(missing, tasks, results):
+            summary = dict(zip(names, np.frombuffer(values, dtype=np.float64).tolist()))
+            store_point(paths[index], task[1], summary)
+
+    return [(point, load_point(path)) for point, path in zip(points, paths)]
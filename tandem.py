@@ -0,0 +1,162 @@
+"""
+Event-free fast path for tandem lines of single-server FIFO stations.
+
+In a series of single-server FIFO stations, the departure times of a stage
+follow Lindley's recursion D_k = max(A_k, D_{k-1}) + S_k, which unrolls to
+
+    D = C + maximum.accumulate(A - C_prev)
+
+with C the cumulative service times and C_prev the same shifted by one
+customer. simulate_series computes a whole stage this way with NumPy, feeds
+its departures to the next stage as arrivals and never touches an event list.
+
+The variates come from the same RandomStreams as OpenQueueNetwork in
+Jackson_network/Open_network_queue.py (interarrival times of station 0,
+service times per station, 3 decimals), and the sums are added in the same
+order, so for the same seed both produce the same agents_data.
+"""
+import numpy as np
+
+from variates import ARRIVALS, SERVICE, RandomStreams
+
+
+def is_tandem(prob_matrix, num_servers):
+    """
+    True if every station has one server and queue i sends everyone to queue i + 1,
+    the last queue sending everyone out of the network
+    """
+    num_queues = len(num_servers)
+    if len(prob_matrix) != num_queues or any(servers != 1 for servers in num_servers):
+        return False
+    for i, row in enumerate(prob_matrix):
+        for j, p in enumerate(row):
+            expected = 1.0 if j == i + 1 and i + 1 < num_queues else 0.0
+            if p != expected:
+                return False
+    return True
+
+
+def arrival_times(stream, max_time, rate):
+    """
+    Draws interarrival times until the arrivals pass max_time,
+    adding them one by one in the order the event simulation does
+    """
+    times = np.zeros(1)
+    expected = rate * max_time
+    while times[-1] <= max_time:
+        chunk = stream.draw_many(int(expected + 5 * np.sqrt(expected)) + 16)
+        times = np.concatenate((times, np.cumsum(np.concatenate((times[-1:], chunk)))[1:]))
+    return times[1:np.searchsorted(times, max_time, side='right')]
+
+
+def busy_period_sums(arrivals, services, first):
+    """
+    Departure times when the agents flagged in first start a busy period:
+    within a busy period D_k = D_{k-1} + S_k, added one by one like the event simulation does.
+    The busy periods are padded to the next power of two and summed with one cumsum per length class
+    """
+    n = len(services)
+    values = services.copy()
+    values[first] += arrivals[first]
+    starts = np.flatnonzero(first)
+    lengths = np.diff(np.append(starts, n))
+    classes = np.ceil(np.log2(lengths)).astype(np.int64)
+    departures = np.empty(n)
+    for length_class in np.unique(classes):
+        width = 1 << int(length_class)
+        in_class = classes == length_class
+        offsets = np.arange(width)
+        index = starts[in_class, None] + offsets
+        inside = offsets < lengths[in_class, None]
+        padded = np.where(inside, values[np.minimum(index, n - 1)], 0.0)
+        departures[index[inside]] = np.cumsum(padded, axis=1)[inside]
+    return departures
+
+
+def lindley(arrivals, services):
+    """
+    Returns (service_start, departure) of a single-server FIFO station
+    """
+    cumulative = np.cumsum(services)
+    departures = cumulative + np.maximum.accumulate(arrivals - (cumulative - services))
+    # The unrolled form rounds differently from the event simulation. Recompute the departures
+    # busy period by busy period, until the busy periods found from them no longer change
+    first = None
+    while True:
+        previous = np.concatenate(([-np.inf], departures[:-1]))
+        new_first = arrivals > previous
+        if first is not None and np.array_equal(new_first, first):
+            break
+        first = new_first
+        departures = busy_period_sums(arrivals, services, first)
+    return np.maximum(arrivals, previous), departures
+
+
+def waiting_on_arrival(arrivals, starts, departures, pushed=None):
+    """
+    Number of agents waiting in line when each agent arrives, as len(queue.queue) in the event simulation.
+
+    Agent j that starts service exactly at the arrival instant of agent k, because agent j - 1
+    departs then, still waits in line if the arrival of k is handled before that departure.
+    An external arrival always is (arrivals come first on a time tie). An arrival routed
+    from the previous stage is created by a departure there, and the two departures are
+    handled in the order they were scheduled, i.e. the order their services started.
+
+    pushed: start of service of each agent at the previous stage, None for the first stage
+    """
+    count = np.arange(len(arrivals))
+    before = np.searchsorted(starts, arrivals, side='left')  # started strictly before the arrival
+    at_or_before = np.minimum(np.searchsorted(starts, arrivals, side='right'), count)
+    waiting = count - at_or_before
+    previous_departures = np.concatenate(([-np.inf], departures[:-1]))
+    previous_starts = np.concatenate(([-np.inf], starts[:-1]))
+    for k in np.flatnonzero(at_or_before > before):
+        tie = slice(before[k], at_or_before[k])
+        # started on the departure of the agent ahead, not on its own arrival
+        queued = previous_departures[tie] == arrivals[k]
+        if pushed is not None:
+            queued &= previous_starts[tie] >= pushed[k]
+        waiting[k] += np.count_nonzero(queued)
+    return waiting
+
+
+def simulate_series(arrival_rate, service_rates, max_time, seed=None, block_size=4096):
+    """
+    Simulates a tandem line of single-server FIFO stations
+
+    Parameters:
+    arrival_rate: external arrival rate at station 0
+    service_rates: list of the service rate of each station
+    max_time: The max simulation time, departures after it are not recorded
+    seed: int or numpy SeedSequence of the random streams, see variates.RandomStreams
+    block_size: block size of the streams
+
+    Returns:
+    array (departures, 7) in the agents_data layout of OpenQueueNetwork (recorder.AGENT_COLUMNS):
+    agent_id, arrival, service_start, departure, server_id, queue_id, queue_length_on_arrival,
+    rows ordered by departure time
+    """
+    streams = RandomStreams(seed, block_size)
+    arrivals = arrival_times(streams.exponential(arrival_rate, ARRIVALS, decimals=3), max_time, arrival_rate)
+    agent_ids = np.arange(1, len(arrivals) + 1, dtype=np.float64)
+    stages = []
+    pushed = None
+    for queue_id, service_rate in enumerate(service_rates):
+        services = streams.exponential(service_rate, SERVICE, queue_id, decimals=3).draw_many(len(arrivals))
+        starts, departures = lindley(arrivals, services)
+        recorded = departures <= max_time
+        stage = np.empty((np.count_nonzero(recorded), 7))
+        stage[:, 0] = agent_ids[recorded]
+        stage[:, 1] = arrivals[recorded]
+        stage[:, 2] = starts[recorded]
+        stage[:, 3] = departures[recorded]
+        stage[:, 4] = 0
+        stage[:, 5] = queue_id
+        stage[:, 6] = waiting_on_arrival(arrivals, starts, departures, pushed)[recorded]
+        stages.append(stage)
+        arrivals = departures
+        pushed = starts
+    data = np.concatenate(stages)
+    # departures at the same time in the order they were scheduled, i.e. by start of service
+    order = np.lexsort((data[:, 0], data[:, 5], data[:, 2], data[:, 3]))
+    return data[order]
@@ -0,0 +1,108 @@
+"""
+Bounded storage for (time, value) series such as the queue length of a station.
+
+A DecimatedSeries keeps at most capacity points in two preallocated NumPy
+arrays. Appended points are gathered in blocks, and each block is stored as its
+minimum and its maximum, in time order. When the arrays are full, every 4
+stored points are reduced to their minimum and maximum the same way and the
+block length doubles. The peaks and dips of the series survive every
+decimation, so a step plot keeps its shape, while the memory stays the same
+however many points are appended.
+"""
+import numpy as np
+
+
+class DecimatedSeries:
+    """
+    Parameters:
+    capacity: maximum number of points kept, rounded up to a multiple of 4
+
+    Attributes:
+    block: number of appended points summarised by one stored (min, max) pair, doubles at every decimation
+    """
+    def __init__(self, capacity=4096):
+        capacity = max(4, -(-capacity // 4) * 4)
+        self.capacity = capacity
+        # 2 spare slots for the block that is still being gathered, see arrays()
+        self.times = np.empty(capacity + 2)
+        self.values = np.empty(capacity + 2)
+        self.size = 0
+        self.block = 2
+        # the block being gathered: count, first, last, minimum and maximum point
+        self.count = 0
+        self.first = self.last = self.low = self.high = None
+
+    def __len__(self):
+        return self.size + min(self.count, 2)
+
+    def append(self, time, value):
+        point = (time, value)
+        if self.count == 0:
+            self.first = self.low = self.high = point
+        elif value < self.low[1]:
+            self.low = point
+        elif value > self.high[1]:
+            self.high = point
+        self.last = point
+        self.count += 1
+        if self.count == self.block:
+            self.flush()
+
+    def pending(self):
+        """
+        Returns the points the block being gathered is stored as
+        """
+        if self.count == 0:
+            return ()
+        if self.count == 1:
+            return (self.first,)
+        if self.low is self.high:
+            # flat block: keep its ends
+            return (self.first, self.last)
+        return (self.low, self.high) if self.low[0] <= self.high[0] else (self.high, self.low)
+
+    def flush(self):
+        size = self.size
+        for time, value in self.pending():
+            self.times[size] = time
+            self.values[size] = value
+            size += 1
+        self.size = size
+        self.count = 0
+        if size >= self.capacity:
+            self.decimate()
+
+    def decimate(self):
+        """
+        Keeps the minimum and the maximum of every 4 stored points and doubles the block length
+        """
+        times = self.times[:self.size].reshape(-1, 4)
+        values = self.values[:self.size].reshape(-1, 4)
+        rows = np.arange(len(values))
+        low = values.argmin(axis=1)
+        high = values.argmax(axis=1)
+        # a flat run keeps its first and last point
+        flat = low == high
+        low[flat] = 0
+        high[flat] = 3
+        first = np.minimum(low, high)
+        second = np.maximum(low, high)
+        # gather before writing back, the arrays are views of the same buffers
+        kept_times = np.stack((times[rows, first], times[rows, second]), axis=1).ravel()
+        kept_values = np.stack((values[rows, first], values[rows, second]), axis=1).ravel()
+        self.size = len(kept_times)
+        self.times[:self.size] = kept_times
+        self.values[:self.size] = kept_values
+        self.block *= 2
+
+    def arrays(self):
+        """
+        Returns (times, values) as views of the stored points, ready for plotting.
+        The block still being gathered is included
+        """
+        end = self.size
+        for time, value in self.pending():
+            self.times[end] = time
+            self.values[end] = value
+            end += 1
+        return self.times[:end], self.values[:end]
@@ -0,0 +1,125 @@
+"""
+Structured tracing for the simulators.
+
+A Tracer replaces the print() calls of the event handlers. A simulator asks the
+tracer once, at construction, which kinds of records it wants and keeps the
+answers as booleans:
+
+    self.trace_arrivals = self.tracer.enabled(ARRIVAL)
+    ...
+    if self.trace_arrivals:
+        self.tracer.emit(ARRIVAL, self.time, agent.agent_id, queue_id, agent.server_id)
+
+With tracing off (the default) the hot path only pays for that attribute check:
+no string is formatted and no record is built.
+
+Record kinds: ARRIVAL and DEPARTURE (the event codes of events.py), REJECTION
+(an agent turned away by a full queue) and TRANSITION (a source -> target move
+in the network graph, as written to master_queue).
+
+Sinks:
+PrintSink: human readable lines on stdout, like the old print() calls
+JsonlSink: one JSON object per line
+BinarySink: fixed-size little-endian records, see BinarySink.RECORD
+"""
+import json
+import struct
+import sys
+
+from events import ARRIVAL, DEPARTURE
+
+REJECTION = 2
+TRANSITION = 3
+
+TRACE_NAMES = ('arrival', 'departure', 'rejection', 'transition')
+
+# levels
+OFF = 0
+INFO = 1    # arrivals, departures and rejections
+DEBUG = 2   # also the network-graph transitions
+
+KIND_LEVELS = {ARRIVAL: INFO, DEPARTURE: INFO, REJECTION: INFO, TRANSITION: DEBUG}
+
+
+class PrintSink:
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.stdout
+
+    def write(self, kind, time, agent_id, queue_id, server_id, source, target):
+        line = f"{TRACE_NAMES[kind].capitalize()} - Time: {time}, Agent ID: {agent_id}, Server ID: {server_id}, Queue ID: {queue_id}"
+        if kind == TRANSITION:
+            line += f", Source: {source}, Target: {target}"
+        print(line, file=self.stream)
+
+    def close(self):
+        pass
+
+
+class JsonlSink:
+    def __init__(self, path):
+        self.file = open(path, 'w')
+
+    def write(self, kind, time, agent_id, queue_id, server_id, source, target):
+        record = {'event': TRACE_NAMES[kind], 'time': time, 'agent_id': agent_id,
+                  'queue_id': queue_id, 'server_id': server_id}
+        if kind == TRANSITION:
+            record['source'] = source
+            record['target'] = target
+        self.file.write(json.dumps(record) + '\n')
+
+    def close(self):
+        self.file.close()
+
+
+class BinarySink:
+    """
+    Writes one RECORD per trace record:
+    kind (uint8), time (float64), agent_id, queue_id, server_id, source, target (int64, -1 for None)
+
+    Read it back with
+    np.fromfile(path, dtype=[('kind', 'u1'), ('time', '<f8'), ('agent_id', '<i8'), ('queue_id', '<i8'),
+                             ('server_id', '<i8'), ('source', '<i8'), ('target', '<i8')])
+    """
+    RECORD = struct.Struct('<Bdqqqqq')
+
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+
+    def write(self, kind, time, agent_id, queue_id, server_id, source, target):
+        self.file.write(self.RECORD.pack(kind, time, *(-1 if value is None else int(value)
+                                                       for value in (agent_id, queue_id, server_id, source, target))))
+
+    def close(self):
+        self.file.close()
+
+
+class Tracer:
+    """
+    Parameters:
+    level: OFF, INFO or DEBUG
+    events: names or codes of the record kinds to keep, e.g. ('departure',). None keeps every kind allowed by level
+    sink: where the records go. Default: PrintSink
+    """
+    def __init__(self, level=OFF, events=None, sink=None):
+        self.level = level
+        self.sink = sink if sink is not None else PrintSink()
+        if events is not None:
+            events = {TRACE_NAMES.index(event) if isinstance(event, str) else event for event in events}
+        self.events = events
+
+    def enabled(self, kind):
+        """
+        True if records of this kind are traced
+        """
+        if self.level < KIND_LEVELS[kind]:
+            return False
+        return self.events is None or kind in self.events
+
+    def emit(self, kind, time, agent_id, queue_id=None, server_id=None, source=None, target=None):
+        self.sink.write(kind, time, agent_id, queue_id, server_id, source, target)
+
+    def close(self):
+        self.sink.close()
+
+
+NULL_TRACER = Tracer(OFF)
@@ -1,5 +1,9 @@
 import math
 
+import numpy as np
+
+from erlang import erlang_c, mmck_distribution
+
 class MMckQueue:
     def __init__(self, arrival_rate, service_rate, num_servers, system_capacity):
         self.lambda_ = arrival_rate
@@ -7,8 +11,8 @@ class MMckQueue:
         self.c = num_servers
         self.k = system_capacity
         self.rho = self.lambda_ / (self.c * self.mu)
-        self.p0 = self._calculate_p0()
         self.pn = self._calculate_pn()
+        self.p0 = self.pn[0]
         self.L = self._calculate_L()
         self.Lq = self._calculate_Lq()
         self.Ls = self.L - self.Lq
@@ -17,25 +21,15 @@ class MMckQueue:
         self.Wq = self.Lq / self.lambda_eff
         self.Ws = 1 / self.mu
 
-    def _calculate_p0(self):
-        sum1 = sum((self.lambda_ / self.mu) ** n / math.factorial(n) for n in range(self.c))
-        sum2 = ((self.lambda_ / self.mu) ** self.c / math.factorial(self.c)) * sum((self.lambda_ / (self.c * self.mu)) ** n for n in range(self.k - self.c + 1))
-        return 1 / (sum1 + sum2)
-
     def _calculate_pn(self):
-        pn = {}
-        for n in range(self.k + 1):
-            if n <= self.c:
-                pn[n] = (self.lambda_ / self.mu) ** n * self.p0 / math.factorial(n)
-            else:
-                pn[n] = (self.lambda_ / self.mu) ** n * self.p0 / (self.c ** (n - self.c) * math.factorial(self.c))
-        return pn
+        # p_0 .. p_k in log space, no factorials: exact for thousands of servers
+        return mmck_distribution(self.lambda_, self.mu, self.c, self.k)
 
     def _calculate_L(self):
-        return sum(n * self.pn[n] for n in range(self.k + 1))
+        return np.arange(self.k + 1) @ self.pn
 
     def _calculate_Lq(self):
-        return sum((n - self.c) * self.pn[n] for n in range(self.c + 1, self.k + 1))
+        return np.maximum(np.arange(self.k + 1) - self.c, 0) @ self.pn
 
     def print_results(self):
         print(f"Utilization factor (rho): {self.rho:.4f}")
@@ -88,28 +82,34 @@ def logging(self):
     print(f'Average time spent in service: {avg_time_in_service:.2f}')
     
     #theoretical results
-    if self.max_queue_length == float("inf"):    
-        rho = self.arrival_rate / (num_servers*self.service_rate)
-        A = 0
-        for a in range(0, num_servers):
-            A += pow((num_servers*rho), a) / math.factorial(a)
-        B = pow((num_servers * rho), num_servers) / (math.factorial(num_servers)*(1-rho)) 
-        pi_0 = 1 /  (A + B)
-        
-        p_custo_gth_service_num = pow((num_servers*rho),num_servers)* pi_0
-        p_custo_gth_service_den = (math.factorial(num_servers))*(1-rho)
-        p_cust_gth_ser = p_custo_gth_service_num / p_custo_gth_service_den
+    num_servers = self.num_servers
+    arrival_rate = self.arrival_rate
+    offered_load = arrival_rate / self.service_rate
+    rho = offered_load / num_servers
+    if self.max_queue_length == float("inf"):
+        p_cust_gth_ser = erlang_c(num_servers, offered_load)
+        # pi_0 = C (1 - rho) c! / a^c, taken through logs
+        pi_0 = math.exp(math.log(p_cust_gth_ser) + math.log(1 - rho) + math.lgamma(num_servers + 1)
+                        - num_servers * math.log(offered_load))
         
         L_q = p_cust_gth_ser * rho / (1 - rho)
         W_q = L_q / arrival_rate
-        L = L_q +  (arrival_rate/service_rate)
+        L = L_q + offered_load
         W = L / arrival_rate
     
     else:
+        # MMmQueue.handle_arrival queues up to max_queue_length + num_servers + 1 agents behind the servers
+        capacity = 2 * num_servers + int(self.max_queue_length) + 1
+        pn = mmck_distribution(arrival_rate, self.service_rate, num_servers, capacity)
+        pi_0 = pn[0]
+        p_cust_gth_ser = pn[num_servers:].sum()
         
-
-
-
+        n = np.arange(capacity + 1)
+        L = n @ pn
+        L_q = np.maximum(n - num_servers, 0) @ pn
+        effective_arrival_rate = arrival_rate * (1 - pn[capacity])
+        W = L / effective_arrival_rate
+        W_q = L_q / effective_arrival_rate
 
     print('\nTheoretical steady-state values:')
     print(f'Steady state: {pi_0}, rho: {rho}, P(cust>server) : {p_cust_gth_ser}')
@@ -0,0 +1,169 @@
+"""
+Buffered random-variate streams.
+
+Drawing one variate per event through np.random costs a NumPy call (and a
+round()) every time. A VariateStream draws a block of variates at once through a
+numpy.random.Generator and hands them out one at a time.
+
+RandomStreams gives every purpose of a simulation run its own stream:
+the external arrivals, the service times of each station and the routing
+decisions of each station. The streams are keyed by purpose and station, so the
+same seed always gives the same draws to the same purpose: two configurations
+run with one seed see common random numbers. Antithetic(seed) gives the same
+streams with every uniform U replaced by 1 - U.
+"""
+import numpy as np
+
+# purposes of the streams
+ARRIVALS = 0
+SERVICE = 1
+ROUTING = 2
+
+
+class VariateStream:
+    """
+    Hands out variates one at a time from blocks of block_size.
+
+    Parameters:
+    rng: numpy.random.Generator the blocks are drawn from
+    scale: mean of the exponential distribution, None for Uniform(0, 1) variates
+    block_size: number of variates drawn at once
+    decimals: number of decimals the variates are rounded to, None to keep them as drawn
+    antithetic: if True, every uniform U is replaced by 1 - U
+
+    Exponential variates are drawn by inversion, -scale * log(1 - U), from one
+    uniform U per variate.
+    """
+    __slots__ = ('rng', 'scale', 'block_size', 'decimals', 'antithetic', 'block', 'index')
+
+    def __init__(self, rng, scale=None, block_size=4096, decimals=None, antithetic=False):
+        self.rng = rng
+        self.scale = scale
+        self.block_size = block_size
+        self.decimals = decimals
+        self.antithetic = antithetic
+        self.block = []
+        self.index = 0
+
+    def next_block(self):
+        """
+        Draws the next block as an array
+        """
+        uniforms = self.rng.random(self.block_size)
+        if self.antithetic:
+            uniforms = 1.0 - uniforms
+        if self.scale is None:
+            variates = uniforms
+        else:
+            variates = -self.scale * np.log1p(-uniforms)
+        if self.decimals is not None:
+            variates = np.round(variates, self.decimals)
+        return variates
+
+    def refill(self):
+        # Python floats are much faster to hand out one by one than NumPy scalars
+        self.block = self.next_block().tolist()
+        self.index = 0
+
+    def draw(self):
+        """
+        Returns the next variate
+        """
+        index = self.index
+        if index == len(self.block):
+            self.refill()
+            index = 0
+        self.index = index + 1
+        return self.block[index]
+
+    def draw_many(self, n):
+        """
+        Returns the next n variates as an array, the same values n calls of draw() return
+        """
+        take = min(n, len(self.block) - self.index)
+        parts = [np.array(self.block[self.index:self.index + take], dtype=np.float64)]
+        self.index += take
+        n -= take
+        # whole blocks stay arrays, only the block left partly used goes to the list draw() reads
+        while n > 0:
+            block = self.next_block()
+            if n < len(block):
+                self.block = block.tolist()
+                self.index = n
+                block = block[:n]
+            else:
+                self.block = []
+                self.index = 0
+            parts.append(block)
+            n -= len(block)
+        return np.concatenate(parts)
+
+
+class Antithetic:
+    """
+    The seed of the antithetic twin of a run: RandomStreams(Antithetic(seed)) draws 1 - U
+    wherever RandomStreams(seed) draws U
+    """
+    __slots__ = ('seed_sequence',)
+
+    def __init__(self, seed=None):
+        self.seed_sequence = as_seed_sequence(seed)
+
+
+def as_seed_sequence(seed=None):
+    """
+    Returns a numpy SeedSequence for seed.
+
+    seed: int, SeedSequence, Antithetic or None.
+          None draws the entropy from the legacy np.random state, so scripts that
+          call np.random.seed() are still reproducible
+    """
+    if isinstance(seed, Antithetic):
+        return seed.seed_sequence
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    if seed is None:
+        seed = int(np.random.randint(0, 2**31 - 1))
+    return np.random.SeedSequence(seed)
+
+
+class RandomStreams:
+    """
+    The random streams of one simulation run.
+
+    Parameters:
+    seed: int, numpy SeedSequence, Antithetic or None (see as_seed_sequence)
+    block_size: block size of the streams
+    """
+    def __init__(self, seed=None, block_size=4096):
+        self.seed_sequence = as_seed_sequence(seed)
+        self.antithetic = isinstance(seed, Antithetic)
+        self.block_size = block_size
+
+    @property
+    def seed(self):
+        """
+        The seed these streams were made from, to make the same streams again
+        """
+        return Antithetic(self.seed_sequence) if self.antithetic else self.seed_sequence
+
+    def generator(self, purpose, station=0):
+        """
+        Returns the numpy Generator of a purpose (ARRIVALS, SERVICE or ROUTING) at a station
+        """
+        seed_sequence = self.seed_sequence
+        child = np.random.SeedSequence(seed_sequence.entropy,
+                                       spawn_key=seed_sequence.spawn_key + (purpose, station))
+        return np.random.default_rng(child)
+
+    def exponential(self, rate, purpose, station=0, decimals=None):
+        """
+        Returns a stream of exponential variates with the given rate
+        """
+        return VariateStream(self.generator(purpose, station), 1.0 / rate, self.block_size, decimals, self.antithetic)
+
+    def uniform(self, purpose, station=0):
+        """
+        Returns a stream of Uniform(0, 1) variates
+        """
+        return VariateStream(self.generator(purpose, station), None, self.block_size, antithetic=self.antithetic)